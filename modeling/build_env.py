@@ -1,13 +1,138 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import numpy as np
-import matplotlib.pyplot as plt
 from data_retrieval import open_meteo_client
 from data_retrieval import google_earth_segmentation
+from data_retrieval.landcover_tiles import LandcoverTileCache
+from data_retrieval.rate_limit import TokenBucket, call_with_retry
+from environment import Environment
+
+# Concurrent build limits (requests per second per service).
+WEATHER_RATE = 8
+LANDCOVER_RATE = 4
+BUILD_WORKERS = 8
+# Retries of a failed chunk request in build_grid_concurrent, the first after RETRY_DELAY seconds.
+RETRIES = 4
+RETRY_DELAY = 0.5
 
 
 # Builds grid of specified grid_size (n x n), based on a fixed central coordinate
-# and radius. Each cell in the grid contains a dictionary of its properties, such as
-# center, temperature, moisture, elevation, etc.
-def build_grid(central_coordinate, radius, grid_size):
+# and radius. The result is an Environment: every cell property (center,
+# temperature, moisture, elevation, fuel type, etc.) is stored in an n x n array,
+# and grid[i][j] still gives a dict-style view of a single cell.
+# Landcover is read from the on-disk tile cache (cached_grid_states/landcover_tiles),
+# which only goes to Earth Engine for tiles it does not have yet.
+# landcover_source overrides it (e.g. a LocalLandcoverRaster offline);
+# Weather comes from the shared per-pixel weather cache (or weather_cache), so
+# only pixels not fetched in the current hour cost a request.
+# weather_url / elevation_url / weather_session can point Open-Meteo requests at a mock server.
+def build_grid(central_coordinate, radius, grid_size, landcover_source=None,
+               weather_url=open_meteo_client.FORECAST_URL, weather_session=None, weather_cache=None,
+               elevation_url=open_meteo_client.ELEVATION_URL):
+    env = Environment.empty(grid_size)
+    env.coords = get_cell_centers(central_coordinate, radius, grid_size)
+
+    # Weather for all cells in a few multi-location requests.
+    weather = open_meteo_client.get_cached_attributes_by_locations(env.coords.reshape(-1, 2), weather_cache,
+                                                                   url=weather_url, elevation_url=elevation_url,
+                                                                   session=weather_session)
+    env.date = weather["Date"][0]
+    for feature in list(open_meteo_client.FEATURE_NAMES.values()) + ["elevation"]:
+        env.fields[feature] = weather[feature].reshape(grid_size, grid_size)
+    set_forecast(env, weather["forecast"], weather["forecast_times"])
+
+    # Landcover for all cell centers in one batched lookup.
+    if landcover_source is None:
+        landcover_source = LandcoverTileCache()
+    landcover = google_earth_segmentation.get_landcover_grid(env.coords[..., 0], env.coords[..., 1], landcover_source)
+    env.fuel, env.fuel_rgb = google_earth_segmentation.landcover_to_fuel(landcover)
+
+    env.original_fuel = env.fuel.copy()
+    env.original_rgb = env.fuel_rgb.copy()
+    print("YESSS! All grid attributes initialized!")
+    return env
+
+# Default progress report for build_grid_concurrent.
+def print_progress(cells_done, total_cells):
+    print(f"Grid attributes initialized: {cells_done}/{total_cells} cells")
+
+# Same result as build_grid, but the Open-Meteo and Earth Engine requests for
+# every chunk of cells run concurrently on a thread pool. Each service has its
+# own token bucket (WEATHER_RATE / LANDCOVER_RATE requests per second), failed
+# requests are retried with exponential backoff, and progress(cells_done, total)
+# is called whenever a chunk has both its weather and its landcover.
+# Retries happen only here, each taking a token: the default weather session
+# does not retry on its own (a weather_session passed in should not either).
+# weather_url / elevation_url / weather_session allow benchmarking against a local mock server.
+def build_grid_concurrent(central_coordinate, radius, grid_size, landcover_source=None,
+                          chunk_size=open_meteo_client.BULK_CHUNK_SIZE, max_workers=BUILD_WORKERS,
+                          weather_url=open_meteo_client.FORECAST_URL, weather_session=None, weather_cache=None,
+                          elevation_url=open_meteo_client.ELEVATION_URL, progress=print_progress):
+    env = Environment.empty(grid_size)
+    env.coords = get_cell_centers(central_coordinate, radius, grid_size)
+    flat_coords = env.coords.reshape(-1, 2)
+    total = len(flat_coords)
+    chunks = [(start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+
+    if landcover_source is None:
+        landcover_source = LandcoverTileCache()
+    if weather_session is None:
+        weather_session = open_meteo_client.new_plain_session()
+    weather_bucket = TokenBucket(WEATHER_RATE)
+    landcover_bucket = TokenBucket(LANDCOVER_RATE)
+    weather = {}
+    landcover = np.zeros(total, dtype=np.int16)
+    parts_left = {chunk: 2 for chunk in chunks}
+    cells_done = 0
+
+    def fetch_weather(start, stop):
+        weather[start] = call_with_retry(
+            lambda: open_meteo_client.get_cached_attributes_by_locations(
+                flat_coords[start:stop], weather_cache, chunk_size=stop - start, url=weather_url,
+                elevation_url=elevation_url, session=weather_session),
+            RETRIES, RETRY_DELAY, weather_bucket)
+
+    def fetch_landcover(start, stop):
+        landcover[start:stop] = call_with_retry(
+            lambda: google_earth_segmentation.get_landcover_grid(flat_coords[start:stop, 0], flat_coords[start:stop, 1],
+                                                                 landcover_source),
+            RETRIES, RETRY_DELAY, landcover_bucket)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        for chunk in chunks:
+            futures[pool.submit(fetch_weather, *chunk)] = chunk
+            futures[pool.submit(fetch_landcover, *chunk)] = chunk
+        for future in as_completed(futures):
+            future.result()
+            chunk = futures[future]
+            parts_left[chunk] -= 1
+            if parts_left[chunk] == 0:
+                cells_done += chunk[1] - chunk[0]
+                if progress is not None:
+                    progress(cells_done, total)
+
+    env.date = weather[0]["Date"][0]
+    for feature in list(open_meteo_client.FEATURE_NAMES.values()) + ["elevation"]:
+        values = np.concatenate([weather[start][feature] for start, _ in chunks])
+        env.fields[feature] = values.reshape(grid_size, grid_size)
+    hours = min(len(weather[start]["forecast_times"]) for start, _ in chunks)
+    set_forecast(env, np.concatenate([weather[start]["forecast"][:hours] for start, _ in chunks], axis=1),
+                 weather[0]["forecast_times"][:hours])
+    env.fuel, env.fuel_rgb = google_earth_segmentation.landcover_to_fuel(landcover.reshape(grid_size, grid_size))
+    env.original_fuel = env.fuel.copy()
+    env.original_rgb = env.fuel_rgb.copy()
+    return env
+
+# Stores the hourly forecast, (hours, cells, features) in FEATURE_NAMES order,
+# on env as an (hours, n, n, features) array.
+def set_forecast(env, forecast, forecast_times):
+    env.forecast = forecast.reshape(forecast.shape[0], env.n, env.n, forecast.shape[-1])
+    env.forecast_times = np.asarray(forecast_times, dtype=np.int64)
+    env.forecast_fields = list(open_meteo_client.FEATURE_NAMES.values())
+
+# (n, n, 2) array of cell centers (lat, lon).
+def get_cell_centers(central_coordinate, radius, grid_size):
     lat_step, lon_step = get_step_size(central_coordinate, radius, grid_size)
 
     # If is n is odd, central coordinate will be in a cell.
@@ -15,34 +140,15 @@ def build_grid(central_coordinate, radius, grid_size):
     lat_origin = central_coordinate[0] - (grid_size / 2) * lat_step
     lon_origin = central_coordinate[1] - (grid_size / 2) * lon_step
 
-    grid = [[{} for _ in range(grid_size)] for _ in range(grid_size)]
-
-    for i in range(grid_size):
-        for j in range(grid_size):
-            lat = lat_origin + (i + 0.5) * lat_step
-            lon = lon_origin + (j + 0.5) * lon_step
-
-            #print(f"Getting attributes for cell ({i}, {j}): ({lat}, {lon})")
-
-            grid[i][j]['central_coord'] = (lat, lon)
-            hourly_data = open_meteo_client.get_attributes_by_location((lat, lon))
-            for feature in hourly_data:
-                grid[i][j][feature] = hourly_data[feature]
-            grid[i][j]["fuel_type"] = google_earth_segmentation.get_landcover_info(lat, lon)[2]
-            grid[i][j]["fuel_type_color"] = google_earth_segmentation.get_landcover_info(lat, lon)[1]
-
-            grid[i][j]["original_fuel_type"] = grid[i][j]["fuel_type"]
-            grid[i][j]["original_color"] = grid[i][j]["fuel_type_color"]
-
-            
-            # print(grid[i][j]["fuel_type"])
-    print("YESSS! All grid attributes initialized!")
-    return grid
+    offsets = np.arange(grid_size) + 0.5
+    lats, lons = np.meshgrid(lat_origin + offsets * lat_step, lon_origin + offsets * lon_step, indexing="ij")
+    return np.stack([lats, lons], axis=-1)
 
 # Visualizes the raw grid, just the central coordinates (without any 
 # other qualifying details). Primarily to make sure cell dimensions and
 # locations are correct.
 def visualize_raw_grid(central_coordinate, radius, grid):
+    import matplotlib.pyplot as plt
     grid_size = len(grid)
     lat_step, lon_step = get_step_size(central_coordinate, radius, grid_size)
 
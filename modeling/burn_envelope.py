@@ -0,0 +1,50 @@
+import numpy as np
+
+import travel_time
+from spread_engine import DIRECTIONS_4, crossed_cells
+
+
+class BurnEnvelope:
+    """
+    Cells the no-firebreak fire can reach, for telling which firebreak
+    candidates can change a simulation at all.
+
+    burn_probability is the per-cell burn probability of the baseline
+    (EnsembleResult.burn_probability); cells burning with probability above
+    `threshold` are in the envelope. A firebreak that reaches() reports as
+    outside it scores as the baseline minus its own area: with threshold=0
+    and the baseline's common random numbers this is exact, otherwise an
+    estimate. A non-burnable cell only changes the spread by not igniting
+    and, over 8- or 16-neighbor stencils, by blocking the diagonal and knight
+    moves across it, so reaches() also checks the cells those moves start
+    from. weight() ranks candidates by how much of the fire corridor they
+    cross, for biasing proposals.
+    """
+
+    def __init__(self, burn_probability, threshold=0.0):
+        self.burn_probability = np.asarray(burn_probability, dtype=np.float64)
+        self.threshold = threshold
+        self.mask = self.burn_probability > threshold
+
+    # Envelope of a deterministic arrival-time field (see travel_time): the
+    # cells the front reaches within `minutes`.
+    @classmethod
+    def from_arrival(cls, arrival, minutes):
+        return cls(travel_time.burned_within(arrival, minutes).astype(np.float64))
+
+    # Whether any of `cells` ((i, j) pairs) is in the envelope, or lies across
+    # a move of the `directions` stencil that starts in the envelope.
+    def reaches(self, cells, directions=DIRECTIONS_4):
+        offsets = {(0, 0)} | {cell for di, dj in directions for cell in crossed_cells(di, dj)}
+        n_i, n_j = self.mask.shape
+        return any(self.mask[i - ci, j - cj] for i, j in cells for ci, cj in offsets
+                   if 0 <= i - ci < n_i and 0 <= j - cj < n_j)
+
+    # Expected number of burning cells a firebreak over `cells` crosses.
+    def weight(self, cells):
+        return float(sum(self.burn_probability[i, j] for i, j in cells))
+
+    # Fraction of the grid inside the envelope.
+    @property
+    def coverage(self):
+        return float(self.mask.mean())
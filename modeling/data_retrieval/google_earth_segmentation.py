@@ -1,12 +1,32 @@
-import ee
-import geemap
+import numpy as np
 
-# Authenticate and initialize Google Earth Engine
-ee.Initialize(project='fuel-type')
+import fuel_models
+from environment import color_to_rgb
 
-# Load dataset
-dataset = ee.Image('ESA/GLOBCOVER_L4_200901_200912_V2_3')
-landcover = dataset.select('landcover')
+# GlobCover's native pixel size in degrees (about 300 m).
+GLOBCOVER_PIXEL_SIZE = 1 / 360
+
+_ee = None
+_landcover = None
+
+
+# Imports, authenticates and initializes Google Earth Engine on first use, so
+# offline builds that read landcover from the tile cache never load the
+# Earth Engine client or need GEE credentials.
+def earth_engine():
+    global _ee
+    if _ee is None:
+        import ee
+        ee.Initialize(project='fuel-type')
+        _ee = ee
+    return _ee
+
+def get_landcover_image():
+    global _landcover
+    if _landcover is None:
+        dataset = earth_engine().Image('ESA/GLOBCOVER_L4_200901_200912_V2_3')
+        _landcover = dataset.select('landcover')
+    return _landcover
 
 # Define landcover visualization parameters
 landcover_palette = {
@@ -73,8 +93,9 @@ globcover_to_fuel_type = {
 
 # Function to get landcover value & color at a coordinate
 def get_landcover_info(lat, lon):
+    ee = earth_engine()
     point = ee.Geometry.Point(lon, lat)
-    landcover_value = landcover.sample(region=point, scale=30).first().get('landcover').getInfo()
+    landcover_value = get_landcover_image().sample(region=point, scale=30).first().get('landcover').getInfo()
     
     # Find corresponding color
     landcover_color = landcover_palette.get(landcover_value, 'Unknown')
@@ -83,6 +104,99 @@ def get_landcover_info(lat, lon):
     
     return landcover_value, landcover_color, fuel_type, landcover_desc
 
+# Lookup tables indexed by GlobCover code (0-255), so a whole grid of landcover
+# values maps to fuel codes / colors with one fancy-indexing operation.
+UNCLASSIFIED = 230
+FUEL_CODE_LUT = np.full(256, fuel_models.code_of("NB9"), dtype=np.int16)
+PALETTE_RGB_LUT = np.tile(np.array(color_to_rgb("Unknown"), dtype=np.uint8), (256, 1))
+for _value, _fuel_type in globcover_to_fuel_type.items():
+    FUEL_CODE_LUT[_value] = fuel_models.code_of(_fuel_type)
+for _value, _color in landcover_palette.items():
+    PALETTE_RGB_LUT[_value] = color_to_rgb(_color)
+
+# Max points per Earth Engine sampleRegions request.
+EE_SAMPLE_CHUNK = 5000
+
+
+class EarthEngineLandcover:
+    """Samples GlobCover at many points with one sampleRegions request per chunk."""
+
+    def sample(self, lats, lons):
+        ee = earth_engine()
+        lats = np.asarray(lats, dtype=np.float64).ravel()
+        lons = np.asarray(lons, dtype=np.float64).ravel()
+        values = np.full(lats.size, UNCLASSIFIED, dtype=np.int16)
+
+        for start in range(0, lats.size, EE_SAMPLE_CHUNK):
+            points = ee.FeatureCollection([
+                ee.Feature(ee.Geometry.Point(float(lon), float(lat)), {"idx": start + k})
+                for k, (lat, lon) in enumerate(zip(lats[start:start + EE_SAMPLE_CHUNK], lons[start:start + EE_SAMPLE_CHUNK]))
+            ])
+            samples = get_landcover_image().sampleRegions(collection=points, properties=["idx"], scale=30, geometries=False).getInfo()
+            for feature in samples["features"]:
+                props = feature["properties"]
+                values[props["idx"]] = props["landcover"]
+        return values
+
+    # GlobCover values for a rows x cols block of pixels whose top-left corner
+    # is (north, west), fetched with one sampleRectangle request.
+    def fetch_tile(self, north, west, pixel_size, shape):
+        ee = earth_engine()
+        rows, cols = shape
+        region = ee.Geometry.Rectangle([west, north - rows * pixel_size, west + cols * pixel_size, north],
+                                       'EPSG:4326', False)
+        image = get_landcover_image().reproject(crs='EPSG:4326',
+                                                crsTransform=[pixel_size, 0, west, 0, -pixel_size, north])
+        block = image.sampleRectangle(region=region, defaultValue=UNCLASSIFIED).get('landcover').getInfo()
+        tile = np.full(shape, UNCLASSIFIED, dtype=np.uint8)
+        block = np.asarray(block, dtype=np.uint8)[:rows, :cols]
+        tile[:block.shape[0], :block.shape[1]] = block
+        return tile
+
+
+class LocalLandcoverRaster:
+    """
+    Offline stand-in for Earth Engine: a GlobCover-coded array covering a
+    lat/lon box, sampled by nearest pixel. Row 0 is the northern edge.
+    """
+
+    def __init__(self, values, north, west, pixel_size):
+        self.values = np.asarray(values)
+        self.north = north
+        self.west = west
+        self.pixel_size = pixel_size
+
+    def sample(self, lats, lons):
+        lats = np.asarray(lats, dtype=np.float64).ravel()
+        lons = np.asarray(lons, dtype=np.float64).ravel()
+        rows = np.floor((self.north - lats) / self.pixel_size).astype(np.int64)
+        cols = np.floor((lons - self.west) / self.pixel_size).astype(np.int64)
+        inside = (rows >= 0) & (rows < self.values.shape[0]) & (cols >= 0) & (cols < self.values.shape[1])
+        values = np.full(lats.size, UNCLASSIFIED, dtype=np.int16)
+        values[inside] = self.values[rows[inside], cols[inside]]
+        return values
+
+    # Same interface as EarthEngineLandcover.fetch_tile: samples the raster at
+    # the center of every pixel of the requested block.
+    def fetch_tile(self, north, west, pixel_size, shape):
+        lats = north - (np.arange(shape[0]) + 0.5) * pixel_size
+        lons = west + (np.arange(shape[1]) + 0.5) * pixel_size
+        lat_grid, lon_grid = np.meshgrid(lats, lons, indexing="ij")
+        return self.sample(lat_grid, lon_grid).reshape(shape).astype(np.uint8)
+
+
+# Landcover values for a whole grid of cell centers in one batched request
+# (or from `source`, e.g. a LocalLandcoverRaster). Returns an array shaped like lats.
+def get_landcover_grid(lats, lons, source=None):
+    source = EarthEngineLandcover() if source is None else source
+    return source.sample(lats, lons).reshape(np.shape(lats))
+
+
+# Vectorized landcover -> (fuel code array, RGB color array) lookup.
+def landcover_to_fuel(values):
+    values = np.asarray(values, dtype=np.int64)
+    return FUEL_CODE_LUT[values], PALETTE_RGB_LUT[values]
+
 # # Example coordinate
 #  # This is in long, lat, vs. lat., long for some reason?
 # longitude, latitude = 118.2426, 34.0549
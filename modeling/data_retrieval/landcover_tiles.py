@@ -0,0 +1,107 @@
+import os
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+from data_retrieval import google_earth_segmentation
+from data_retrieval.google_earth_segmentation import GLOBCOVER_PIXEL_SIZE, UNCLASSIFIED
+
+# Tiles live next to the saved grid states, one .npy per tile.
+TILE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+                              "cached_grid_states", "landcover_tiles")
+
+# Tile edge in GlobCover pixels (256 * 1/360 deg, about 77 km).
+TILE_PIXELS = 256
+
+
+class LandcoverTileCache:
+    """
+    Persistent landcover cache. GlobCover is static, so it is stored as
+    TILE_PIXELS x TILE_PIXELS uint8 tiles on its native pixel grid, keyed by
+    tile (row, col) counted from (90N, 180W). Tiles on disk are memory-mapped;
+    only missing tiles are fetched from `source` (Earth Engine by default).
+    Same sample(lats, lons) interface as the landcover sources, so it can be
+    passed to build_grid as landcover_source.
+    """
+
+    def __init__(self, source=None, cache_dir=TILE_CACHE_DIR, tile_pixels=TILE_PIXELS,
+                 pixel_size=GLOBCOVER_PIXEL_SIZE):
+        self.source = source
+        self.cache_dir = cache_dir
+        self.tile_pixels = tile_pixels
+        self.pixel_size = pixel_size
+        self.tiles = {}
+        self.loading = {}  # (row, col) -> Future of a tile being read or fetched
+        self.tiles_fetched = 0
+        self.lock = threading.Lock()
+
+    def tile_path(self, row, col):
+        return os.path.join(self.cache_dir, f"{row}_{col}.npy")
+
+    # Returns tile (row, col), reading it from disk or fetching and saving it.
+    # The lock only guards the tile dicts: reads and fetches run outside it,
+    # so different tiles load in parallel, and threads asking for a tile that
+    # is already loading wait on its future instead of fetching it again.
+    def get_tile(self, row, col):
+        key = (row, col)
+        with self.lock:
+            tile = self.tiles.get(key)
+            if tile is not None:
+                return tile
+            future = self.loading.get(key)
+            loader = future is None
+            if loader:
+                future = self.loading[key] = Future()
+                if self.source is None:
+                    self.source = google_earth_segmentation.EarthEngineLandcover()
+        if not loader:
+            return future.result()
+
+        try:
+            tile = self.load_tile(row, col)
+        except BaseException as error:
+            with self.lock:
+                del self.loading[key]
+            future.set_exception(error)
+            raise
+        with self.lock:
+            self.tiles[key] = tile
+            del self.loading[key]
+        future.set_result(tile)
+        return tile
+
+    # Reads tile (row, col) from disk, fetching and saving it first if missing.
+    # Tiles are written to a temporary file and renamed, so concurrent builds
+    # never see a partially written tile.
+    def load_tile(self, row, col):
+        path = self.tile_path(row, col)
+        if not os.path.exists(path):
+            north = 90 - row * self.tile_pixels * self.pixel_size
+            west = -180 + col * self.tile_pixels * self.pixel_size
+            values = self.source.fetch_tile(north, west, self.pixel_size, (self.tile_pixels, self.tile_pixels))
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, np.asarray(values, dtype=np.uint8))
+            os.replace(tmp_path, path)
+            with self.lock:
+                self.tiles_fetched += 1
+        return np.load(path, mmap_mode="r")
+
+    def sample(self, lats, lons):
+        lats = np.asarray(lats, dtype=np.float64).ravel()
+        lons = np.asarray(lons, dtype=np.float64).ravel()
+        pixel_rows = np.floor((90 - lats) / self.pixel_size).astype(np.int64)
+        pixel_cols = np.floor((lons + 180) / self.pixel_size).astype(np.int64)
+        tile_rows, rows = np.divmod(pixel_rows, self.tile_pixels)
+        tile_cols, cols = np.divmod(pixel_cols, self.tile_pixels)
+
+        values = np.full(lats.size, UNCLASSIFIED, dtype=np.int16)
+        tile_keys, tile_of_point = np.unique(np.stack([tile_rows, tile_cols], axis=1), axis=0, return_inverse=True)
+        tile_of_point = tile_of_point.ravel()
+        for k, (row, col) in enumerate(tile_keys):
+            in_tile = tile_of_point == k
+            tile = self.get_tile(int(row), int(col))
+            values[in_tile] = tile[rows[in_tile], cols[in_tile]]
+        return values
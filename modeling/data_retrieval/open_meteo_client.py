@@ -1,18 +1,71 @@
-import openmeteo_requests
-import requests_cache
-import pandas as pd
 import numpy as np
-from retry_requests import retry
 from datetime import datetime, timezone
+from data_retrieval.weather_cache import WeatherCache, forecast_hour, quantize
 
-# Setup Open-Meteo API client with cache and retry on error
-cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
-retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-openmeteo = openmeteo_requests.Client(session=retry_session)
+# The Open-Meteo SDK, requests-cache and pandas are imported on first use, so
+# importing this module (and the spread model that depends on it) stays cheap.
+_openmeteo = None
+_fetch_session = None
+
+
+# Open-Meteo SDK client with a URL cache and retry on error.
+def get_openmeteo():
+    global _openmeteo
+    if _openmeteo is None:
+        import openmeteo_requests
+        import requests_cache
+        from retry_requests import retry
+        cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
+        retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
+        _openmeteo = openmeteo_requests.Client(session=retry_session)
+    return _openmeteo
+
+
+# Plain retrying session for the bulk requests, which are cached per weather
+# pixel by WeatherCache instead of per URL.
+def get_fetch_session():
+    global _fetch_session
+    if _fetch_session is None:
+        from retry_requests import retry
+        _fetch_session = retry(retries=5, backoff_factor=0.2)
+    return _fetch_session
+
+# Session without retries, for callers that retry each attempt themselves
+# (build_env.build_grid_concurrent, which also rate-limits every attempt).
+def new_plain_session():
+    import requests
+    return requests.Session()
+
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+ELEVATION_URL = "https://api.open-meteo.com/v1/elevation"
+
+# Open-Meteo hourly variable -> feature name stored on the grid.
+FEATURE_NAMES = {
+    "temperature_2m": "Temperature (2 m)",
+    "soil_moisture_0_to_10cm": "Soil Moisture (0-10 cm)",
+    "soil_moisture_10_to_40cm": "Soil Moisture (10-40 cm)",
+    "soil_moisture_40_to_100cm": "Soil Moisture (40-100 cm)",
+    "soil_moisture_100_to_200cm": "Soil Moisture (100-200 cm)",
+    "soil_temperature_0_to_10cm": "Soil Temperature (0-10 cm)",
+    "soil_temperature_10_to_40cm": "Soil Temperature (10-40 cm)",
+    "soil_temperature_40_to_100cm": "Soil Temperature (40-100 cm)",
+    "soil_temperature_100_to_200cm": "Soil Temperature (100-200 cm)",
+    "surface_temperature": "Surface Temperature",
+    "temperature_80m": "Temperature (80 m)",
+    "wind_speed_80m": "Wind Speed (80 m)",
+    "wind_direction_80m": "Wind Direction (80 m)"
+}
+
+# Max coordinates per multi-location request.
+BULK_CHUNK_SIZE = 100
+
+# Hours of forecast kept from the current hour onward.
+FORECAST_HOURS = 48
 
 # Pulls latest data based on closest hourly time (to current) in UCT.
 def get_attributes_by_location(location):
-    url = "https://api.open-meteo.com/v1/forecast"
+    import pandas as pd
+    url = FORECAST_URL
     params = {
         "latitude": location[0],
         "longitude": location[1],
@@ -24,7 +77,7 @@ def get_attributes_by_location(location):
         "models": "best_match"
     }
     
-    responses = openmeteo.weather_api(url, params=params)
+    responses = get_openmeteo().weather_api(url, params=params)
     response = responses[0]
     elevation = response.Elevation()
     #print(f"Debug API Response: {response}")
@@ -35,21 +88,7 @@ def get_attributes_by_location(location):
     num_vars = hourly.VariablesLength()
     #print(f"Number of available variables: {num_vars}")
 
-    feature_names = {
-        "temperature_2m": "Temperature (2 m)",
-        "soil_moisture_0_to_10cm": "Soil Moisture (0-10 cm)",
-        "soil_moisture_10_to_40cm": "Soil Moisture (10-40 cm)",
-        "soil_moisture_40_to_100cm": "Soil Moisture (40-100 cm)",
-        "soil_moisture_100_to_200cm": "Soil Moisture (100-200 cm)",
-        "soil_temperature_0_to_10cm": "Soil Temperature (0-10 cm)",
-        "soil_temperature_10_to_40cm": "Soil Temperature (10-40 cm)",
-        "soil_temperature_40_to_100cm": "Soil Temperature (40-100 cm)",
-        "soil_temperature_100_to_200cm": "Soil Temperature (100-200 cm)",
-        "surface_temperature": "Surface Temperature",
-        "temperature_80m": "Temperature (80 m)",
-        "wind_speed_80m": "Wind Speed (80 m)",
-        "wind_direction_80m": "Wind Direction (80 m)"
-    }
+    feature_names = FEATURE_NAMES
 
     # Convert timestamps to pandas datetime format.
     timestamps = pd.date_range(
@@ -82,5 +121,130 @@ def get_attributes_by_location(location):
     # print(hourly_data)
     return hourly_data
 
+# Bulk version of get_attributes_by_location for many coordinates.
+# Coordinates are sent as comma-separated latitude/longitude lists, chunk_size
+# per request, and the JSON responses are decoded into arrays. For every
+# location the hour closest to now (UTC) is selected, as in the single version.
+# Returns {"Date": [Timestamp per location], "elevation": array, feature: array}
+# with arrays in the order of `locations`, plus "hourly": (count, FORECAST_HOURS,
+# features) float32 series starting at the selected hour (features in
+# FEATURE_NAMES order, NaN past the end of the forecast) and "hourly_length":
+# the number of hours actually available per location.
+# url/session can point at a stub server.
+def get_attributes_by_locations(locations, chunk_size=BULK_CHUNK_SIZE, url=FORECAST_URL, session=None):
+    import pandas as pd
+    session = get_fetch_session() if session is None else session
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+    count = len(locations)
+
+    results = {"Date": [None] * count, "elevation": np.zeros(count, dtype=np.float32)}
+    for name in FEATURE_NAMES.values():
+        results[name] = np.full(count, np.nan, dtype=np.float32)
+    results["hourly"] = np.full((count, FORECAST_HOURS, len(FEATURE_NAMES)), np.nan, dtype=np.float32)
+    results["hourly_length"] = np.zeros(count, dtype=np.int64)
+    current_time = datetime.now(timezone.utc).timestamp()
+
+    for start in range(0, count, chunk_size):
+        chunk = locations[start:start + chunk_size]
+        params = {
+            "latitude": ",".join(f"{lat:.6f}" for lat in chunk[:, 0]),
+            "longitude": ",".join(f"{lon:.6f}" for lon in chunk[:, 1]),
+            "hourly": ",".join(FEATURE_NAMES),
+            "models": "best_match",
+            "timeformat": "unixtime",
+        }
+        response = session.get(url, params=params)
+        response.raise_for_status()
+        payload = response.json()
+        if isinstance(payload, dict):  # Single location is not wrapped in a list
+            payload = [payload]
+        if len(payload) != len(chunk):
+            raise ValueError(f"Expected {len(chunk)} locations from Open-Meteo, got {len(payload)}")
+
+        for k, item in enumerate(payload):
+            idx = start + k
+            hourly = item["hourly"]
+            times = np.asarray(hourly["time"], dtype=np.int64)
+            closest_idx = int(np.argmin(np.abs(times - current_time)))
+            results["Date"][idx] = pd.to_datetime(times[closest_idx], unit="s", utc=True)
+            results["elevation"][idx] = item.get("elevation", 0.0)
+            length = min(FORECAST_HOURS, len(times) - closest_idx)
+            results["hourly_length"][idx] = length
+            for v, (variable, name) in enumerate(FEATURE_NAMES.items()):
+                values = hourly.get(variable)
+                if values is None:
+                    print(f"Warning: {variable} is missing in the response!")
+                    continue
+                series = np.array(values[closest_idx:closest_idx + length], dtype=np.float32)  # None -> NaN
+                results["hourly"][idx, :length, v] = series
+                results[name][idx] = series[0]
+
+    return results
+
+# Elevation (m) of every location from the Open-Meteo elevation API, chunk_size
+# coordinates per request.
+def get_elevations(locations, chunk_size=BULK_CHUNK_SIZE, url=ELEVATION_URL, session=None):
+    session = get_fetch_session() if session is None else session
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+    elevations = np.zeros(len(locations), dtype=np.float32)
+    for start in range(0, len(locations), chunk_size):
+        chunk = locations[start:start + chunk_size]
+        params = {
+            "latitude": ",".join(f"{lat:.6f}" for lat in chunk[:, 0]),
+            "longitude": ",".join(f"{lon:.6f}" for lon in chunk[:, 1]),
+        }
+        response = session.get(url, params=params)
+        response.raise_for_status()
+        elevations[start:start + len(chunk)] = response.json()["elevation"]
+    return elevations
+
+# Same result as get_attributes_by_locations, but weather is looked up per
+# weather-model pixel in `cache` (a WeatherCache; the shared default if None):
+# locations are quantized to cache.pixel_deg, and only pixels missing for the
+# current forecast hour are fetched, at their pixel centers. Elevation varies
+# within a pixel, so it is looked up per location (cached without expiry) and
+# only fetched from the elevation API for locations not seen before.
+# The hourly series is returned as "forecast": (hours, count, features) with
+# "forecast_times" (unix seconds), trimmed to the hours every location has.
+def get_cached_attributes_by_locations(locations, cache=None, chunk_size=BULK_CHUNK_SIZE, url=FORECAST_URL,
+                                       elevation_url=ELEVATION_URL, session=None):
+    import pandas as pd
+    cache = default_weather_cache() if cache is None else cache
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+    hour = forecast_hour()
+
+    pixels, pixel_of_location = np.unique(quantize(locations, cache.pixel_deg), axis=0, return_inverse=True)
+    pixel_keys = [tuple(int(v) for v in pixel) for pixel in pixels]
+    cached = cache.get_many(pixel_keys, hour)
+    missing = [k for k, key in enumerate(pixel_keys) if key not in cached]
+    if missing:
+        fetched = get_attributes_by_locations(pixels[missing] * cache.pixel_deg, chunk_size, url, session)
+        entries = {pixel_keys[k]: fetched["hourly"][m, :fetched["hourly_length"][m]] for m, k in enumerate(missing)}
+        cache.put_many(entries, hour)
+        cached.update(entries)
+
+    series = [cached[key].reshape(-1, len(FEATURE_NAMES)) for key in pixel_keys]
+    hours = min(len(s) for s in series)
+    forecast = np.stack([s[:hours] for s in series])[pixel_of_location.ravel()].transpose(1, 0, 2)
+    elevations = cache.get_elevations(locations)
+    unknown = np.isnan(elevations)
+    if unknown.any():
+        elevations[unknown] = get_elevations(locations[unknown], chunk_size, elevation_url, session)
+        cache.put_elevations(locations[unknown], elevations[unknown])
+
+    results = {"Date": [pd.to_datetime(hour, unit="s", utc=True)] * len(locations), "elevation": elevations,
+               "forecast": np.ascontiguousarray(forecast), "forecast_times": hour + 3600 * np.arange(hours)}
+    for k, name in enumerate(FEATURE_NAMES.values()):
+        results[name] = forecast[0, :, k].copy()
+    return results
+
+_weather_cache = None
+
+def default_weather_cache():
+    global _weather_cache
+    if _weather_cache is None:
+        _weather_cache = WeatherCache()
+    return _weather_cache
+
 # Test it.
 # get_attributes_by_location((34.0549, -118.2426))
@@ -0,0 +1,43 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: allows `rate` requests per second on average,
+    with bursts of up to `capacity`. acquire() blocks until a token is free.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Calls fn(), retrying on any exception with exponential backoff
+# (base_delay, 2 * base_delay, ...). Each attempt first takes a token from
+# `bucket` if one is given. Re-raises the last error after `retries` retries.
+def call_with_retry(fn, retries=4, base_delay=0.5, bucket=None):
+    for attempt in range(retries + 1):
+        if bucket is not None:
+            bucket.acquire()
+        try:
+            return fn()
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(base_delay * 2 ** attempt)
@@ -0,0 +1,144 @@
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# Default cache file, shared by every process that builds grids.
+WEATHER_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..",
+                                  "cached_grid_states", "weather_cache.sqlite")
+
+# Weather pixel size in degrees: about the 3 km HRRR grid that Open-Meteo's
+# best_match uses over North America. Cells in the same pixel share a fetch.
+WEATHER_PIXEL_DEG = 0.025
+
+# Elevation never changes, so it is cached without TTL at a resolution finer
+# than Open-Meteo's 90 m DEM.
+ELEVATION_PIXEL_DEG = 0.0001
+
+# Forecasts refresh hourly.
+WEATHER_TTL = 3600
+WEATHER_MAX_ENTRIES = 200000
+
+
+# Integer (lat, lon) pixel indices of an (m, 2) array of locations.
+def quantize(locations, pixel_deg=WEATHER_PIXEL_DEG):
+    return np.round(np.asarray(locations, dtype=np.float64).reshape(-1, 2) / pixel_deg).astype(np.int64)
+
+
+# Forecast hour (unix seconds) closest to `now`, the hour every fetch selects.
+def forecast_hour(now=None):
+    now = time.time() if now is None else now
+    return int(round(now / 3600)) * 3600
+
+
+class WeatherCache:
+    """
+    Hourly weather series keyed on (quantized lat, quantized lon, forecast
+    hour); each series starts at that hour.
+
+    Stored in SQLite in WAL mode, so worker processes and threads can share
+    one file; each thread gets its own connection. Entries older than `ttl`
+    seconds are treated as missing and purged, and once the cache holds more
+    than `max_entries` the least recently used are evicted. hits / misses
+    count weather lookups made through this instance.
+    Elevations are kept in a second table, keyed on ELEVATION_PIXEL_DEG
+    pixels, and never expire.
+    """
+
+    def __init__(self, path=WEATHER_CACHE_PATH, pixel_deg=WEATHER_PIXEL_DEG, ttl=WEATHER_TTL,
+                 max_entries=WEATHER_MAX_ENTRIES):
+        self.path = path
+        self.pixel_deg = pixel_deg
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.local = threading.local()
+        self.counter_lock = threading.Lock()
+        with self.connection() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS forecast (
+                                lat_q INTEGER, lon_q INTEGER, hour INTEGER,
+                                fetched REAL, last_used REAL, series BLOB,
+                                PRIMARY KEY (lat_q, lon_q, hour))""")
+            conn.execute("CREATE INDEX IF NOT EXISTS forecast_last_used ON forecast (last_used)")
+            conn.execute("""CREATE TABLE IF NOT EXISTS elevation (
+                                lat_q INTEGER, lon_q INTEGER, elevation REAL,
+                                PRIMARY KEY (lat_q, lon_q))""")
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    # Looks up pixel keys for one forecast hour. Returns {(lat_q, lon_q): series}
+    # (flat float32, hours x features in FEATURE_NAMES order) for the keys that
+    # are cached and fresh.
+    def get_many(self, keys, hour):
+        now = time.time()
+        found = {}
+        with self.connection() as conn:
+            for lat_q, lon_q in keys:
+                row = conn.execute("SELECT series FROM forecast "
+                                   "WHERE lat_q = ? AND lon_q = ? AND hour = ? AND fetched >= ?",
+                                   (int(lat_q), int(lon_q), hour, now - self.ttl)).fetchone()
+                if row is not None:
+                    found[(int(lat_q), int(lon_q))] = np.frombuffer(row[0], dtype=np.float32)
+            conn.executemany("UPDATE forecast SET last_used = ? WHERE lat_q = ? AND lon_q = ? AND hour = ?",
+                             [(now, lat_q, lon_q, hour) for lat_q, lon_q in found])
+        with self.counter_lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    # Stores {(lat_q, lon_q): series} for one forecast hour, then
+    # applies TTL and LRU eviction.
+    def put_many(self, entries, hour):
+        now = time.time()
+        with self.connection() as conn:
+            conn.executemany("INSERT OR REPLACE INTO forecast VALUES (?, ?, ?, ?, ?, ?)",
+                             [(int(lat_q), int(lon_q), hour, now, now, np.asarray(series, dtype=np.float32).tobytes())
+                              for (lat_q, lon_q), series in entries.items()])
+            conn.execute("DELETE FROM forecast WHERE fetched < ?", (now - self.ttl,))
+            excess = conn.execute("SELECT COUNT(*) FROM forecast").fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute("DELETE FROM forecast WHERE rowid IN "
+                             "(SELECT rowid FROM forecast ORDER BY last_used LIMIT ?)", (excess,))
+
+    # Cached elevations of an (m, 2) array of locations; NaN where missing.
+    def get_elevations(self, locations):
+        keys = quantize(locations, ELEVATION_PIXEL_DEG)
+        elevations = np.full(len(keys), np.nan, dtype=np.float32)
+        conn = self.connection()
+        for k, (lat_q, lon_q) in enumerate(keys):
+            row = conn.execute("SELECT elevation FROM elevation WHERE lat_q = ? AND lon_q = ?",
+                               (int(lat_q), int(lon_q))).fetchone()
+            if row is not None:
+                elevations[k] = row[0]
+        return elevations
+
+    def put_elevations(self, locations, elevations):
+        keys = quantize(locations, ELEVATION_PIXEL_DEG)
+        with self.connection() as conn:
+            conn.executemany("INSERT OR REPLACE INTO elevation VALUES (?, ?, ?)",
+                             [(int(lat_q), int(lon_q), float(elevation))
+                              for (lat_q, lon_q), elevation in zip(keys, elevations)])
+
+    def __len__(self):
+        return self.connection().execute("SELECT COUNT(*) FROM forecast").fetchone()[0]
+
+    def clear(self):
+        with self.connection() as conn:
+            conn.execute("DELETE FROM forecast")
+            conn.execute("DELETE FROM elevation")
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -0,0 +1,139 @@
+import json
+import os
+import pickle
+from datetime import datetime
+
+import numpy as np
+
+import fuel_models
+from environment import Environment, as_environment
+
+# On-disk environment format: a directory holding one .npy file per array plus
+# header.json describing them. Arrays are memory-mapped on load, so opening an
+# environment only reads the header, whatever the grid size.
+#
+#   header.json        format, version, grid_size, center, radius, fetch_time,
+#                      fuel_codes, and the .npy file of every Open-Meteo field
+#   coords.npy         (n, n, 2) float64
+#   fuel.npy, original_fuel.npy        (n, n) int16 indices into fuel_codes
+#   fuel_rgb.npy, original_rgb.npy     (n, n, 3) uint8
+#   field_<k>.npy      (n, n) float32
+#   forecast.npy       optional (hours, n, n, features) float32 hourly forecast;
+#                      its times and feature names are in the header
+FORMAT_NAME = "wildfire-env"
+FORMAT_VERSION = 1
+HEADER_FILE = "header.json"
+ARRAY_FILES = ("coords", "fuel", "fuel_rgb", "original_fuel", "original_rgb")
+
+
+# Writes env to the directory `path` (created if needed). center / radius are
+# the build parameters; if omitted they are inferred from the cell centers.
+def save_environment(env, path, center=None, radius=None):
+    env = as_environment(env)
+    if center is None or radius is None:
+        inferred_center, inferred_radius = infer_extent(env)
+        center = inferred_center if center is None else center
+        radius = inferred_radius if radius is None else radius
+
+    os.makedirs(path, exist_ok=True)
+    for name in ARRAY_FILES:
+        np.save(os.path.join(path, name + ".npy"), getattr(env, name))
+    fields = {}
+    for k, (name, values) in enumerate(env.fields.items()):
+        fields[name] = f"field_{k}.npy"
+        np.save(os.path.join(path, fields[name]), values)
+    forecast = None
+    if env.forecast is not None:
+        forecast = {"file": "forecast.npy", "times": [int(t) for t in env.forecast_times],
+                    "fields": list(env.forecast_fields)}
+        np.save(os.path.join(path, forecast["file"]), env.forecast)
+
+    header = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "grid_size": env.n,
+        "center": [float(center[0]), float(center[1])],
+        "radius": float(radius),
+        "fetch_time": None if env.date is None else env.date.isoformat(),
+        "fuel_codes": list(fuel_models.FUEL_CODES),
+        "fields": fields,
+        "forecast": forecast,
+    }
+    # Header last: a directory without one is an incomplete write.
+    with open(os.path.join(path, HEADER_FILE), "w") as f:
+        json.dump(header, f, indent=2)
+
+
+def read_header(path):
+    with open(os.path.join(path, HEADER_FILE)) as f:
+        header = json.load(f)
+    if header.get("format") != FORMAT_NAME:
+        raise ValueError(f"{path} is not a saved environment")
+    if header["version"] > FORMAT_VERSION:
+        raise ValueError(f"{path} uses environment format version {header['version']}, "
+                         f"newer than the supported version {FORMAT_VERSION}")
+    if header["fuel_codes"] != list(fuel_models.FUEL_CODES):
+        raise ValueError(f"{path} was saved with a different fuel code table")
+    return header
+
+
+# Opens a saved environment. Arrays are memory-mapped copy-on-write, so nothing
+# is read until it is used and in-place edits (e.g. firebreaks) never reach the
+# files. mmap=False reads everything into memory instead.
+def load_environment(path, mmap=True):
+    header = read_header(path)
+    mode = "c" if mmap else None
+
+    def load(file_name):
+        return np.load(os.path.join(path, file_name), mmap_mode=mode)
+
+    arrays = {name: load(name + ".npy") for name in ARRAY_FILES}
+    fields = {name: load(file_name) for name, file_name in header["fields"].items()}
+    date = None if header["fetch_time"] is None else datetime.fromisoformat(header["fetch_time"])
+    forecast = header.get("forecast")
+    if forecast is None:
+        forecast = {"file": None, "times": None, "fields": ()}
+    return Environment(arrays["coords"], fields, arrays["fuel"], arrays["fuel_rgb"], date,
+                       arrays["original_fuel"], arrays["original_rgb"],
+                       None if forecast["file"] is None else load(forecast["file"]),
+                       forecast["times"], forecast["fields"])
+
+
+# Center (lat, lon) and radius (km) of the area an environment covers,
+# inverting build_env.get_step_size.
+def infer_extent(env):
+    center = env.coords.reshape(-1, 2).mean(axis=0)
+    if env.n < 2:
+        return (float(center[0]), float(center[1])), 0.0
+    lat_step = float(env.coords[1, 0, 0] - env.coords[0, 0, 0])
+    return (float(center[0]), float(center[1])), round(abs(lat_step) * 111 * env.n / 2, 6)
+
+
+# Converts a legacy pickled grid (list of dicts or Environment) to the
+# directory format and returns the loaded Environment. Pickles can run
+# arbitrary code, so only convert files from trusted sources.
+def convert_pickle(pickle_path, path, center=None, radius=None):
+    with open(pickle_path, "rb") as f:
+        env = as_environment(pickle.load(f))
+    save_environment(env, path, center, radius)
+    return load_environment(path)
+
+
+# Loads the environment saved at `path`, migrating a legacy `path`.pkl pickle
+# to the directory format the first time. Returns None if neither exists.
+def load_or_convert(path):
+    if os.path.exists(os.path.join(path, HEADER_FILE)):
+        return load_environment(path)
+    if os.path.exists(path + ".pkl"):
+        return convert_pickle(path + ".pkl", path)
+    return None
+
+
+# Converts every env_N.pkl in cached_grid_states/environments.
+if __name__ == "__main__":
+    env_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cached_grid_states", "environments")
+    for file_name in sorted(os.listdir(env_dir)):
+        if file_name.endswith(".pkl"):
+            out = os.path.join(env_dir, file_name[:-len(".pkl")])
+            env = convert_pickle(os.path.join(env_dir, file_name), out)
+            print(f"{file_name} -> {os.path.basename(out)}/ ({env.n}x{env.n}, {len(env.fields)} fields)")
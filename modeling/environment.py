@@ -0,0 +1,284 @@
+from collections.abc import MutableMapping
+
+import numpy as np
+
+import fuel_models
+
+# Keys of the old per-cell dicts that are not plain numeric Open-Meteo fields.
+CELL_META_KEYS = ("central_coord", "Date", "fuel_type", "fuel_type_color",
+                  "original_fuel_type", "original_color")
+
+# Open-Meteo feature names used by the spread model.
+ELEVATION = "elevation"
+TEMPERATURE = "Temperature (2 m)"
+SOIL_MOISTURE = "Soil Moisture (0-10 cm)"
+WIND_SPEED = "Wind Speed (80 m)"
+WIND_DIRECTION = "Wind Direction (80 m)"
+
+NAMED_COLORS = {
+    "white": (255, 255, 255),
+    "black": (0, 0, 0),
+    "red": (255, 0, 0),
+}
+UNKNOWN_COLOR = (128, 128, 128)
+
+
+def color_to_rgb(color):
+    if color in NAMED_COLORS:
+        return NAMED_COLORS[color]
+    if isinstance(color, str) and color.startswith("#") and len(color) == 7:
+        return tuple(int(color[k:k + 2], 16) for k in (1, 3, 5))
+    return UNKNOWN_COLOR
+
+
+def rgb_to_color(rgb):
+    return "#{:02x}{:02x}{:02x}".format(*(int(c) for c in rgb))
+
+
+class Environment:
+    """
+    Struct-of-arrays environment grid.
+
+    Every per-cell attribute lives in one n x n array:
+        coords:          (n, n, 2) float64 cell center (lat, lon)
+        fields:          {feature name: (n, n) float32} for every Open-Meteo field
+        fuel:            (n, n) int16 index into fuel_models.FUEL_CODES
+        fuel_rgb:        (n, n, 3) uint8 display color
+        original_fuel / original_rgb: values at build time (before firebreaks)
+        forecast:        optional (hours, n, n, len(forecast_fields)) float32 hourly
+                         weather from `date` onward; fields holds hour 0
+        forecast_times:  (hours,) int64 unix seconds of the forecast hours
+        derived:         cache of arrays computed from the above (e.g. spread-model
+                         inputs), keyed by whoever produced them
+
+    env[i][j] returns a dict-style view of a single cell so code written
+    against the old list-of-dicts grid keeps working.
+    """
+
+    # Defaults for environments pickled before the forecast existed.
+    forecast = None
+    forecast_times = None
+    forecast_fields = ()
+
+    def __init__(self, coords, fields, fuel, fuel_rgb, date=None,
+                 original_fuel=None, original_rgb=None, forecast=None, forecast_times=None, forecast_fields=()):
+        self.coords = np.asarray(coords, dtype=np.float64)
+        self.n = self.coords.shape[0]
+        self.fields = {name: np.asarray(values, dtype=np.float32) for name, values in fields.items()}
+        self.fuel = np.asarray(fuel, dtype=np.int16)
+        self.fuel_rgb = np.asarray(fuel_rgb, dtype=np.uint8)
+        self.original_fuel = self.fuel.copy() if original_fuel is None else np.asarray(original_fuel, dtype=np.int16)
+        self.original_rgb = self.fuel_rgb.copy() if original_rgb is None else np.asarray(original_rgb, dtype=np.uint8)
+        self.date = date
+        self.forecast = None if forecast is None else np.asarray(forecast, dtype=np.float32)
+        self.forecast_times = None if forecast_times is None else np.asarray(forecast_times, dtype=np.int64)
+        self.forecast_fields = list(forecast_fields)
+        self.derived = {}
+
+    # Allocates an empty n x n environment to be filled cell by cell.
+    @classmethod
+    def empty(cls, grid_size, field_names=()):
+        n = grid_size
+        return cls(
+            coords=np.zeros((n, n, 2)),
+            fields={name: np.full((n, n), np.nan, dtype=np.float32) for name in field_names},
+            fuel=np.zeros((n, n), dtype=np.int16),
+            fuel_rgb=np.zeros((n, n, 3), dtype=np.uint8),
+        )
+
+    # Converts an old list-of-dicts grid into an Environment.
+    @classmethod
+    def from_grid(cls, grid):
+        n = len(grid)
+        field_names = [key for key in grid[0][0] if key not in CELL_META_KEYS]
+        env = cls.empty(n, field_names)
+        env.date = grid[0][0].get("Date")
+        for i in range(n):
+            for j in range(n):
+                cell = grid[i][j]
+                env.coords[i, j] = cell["central_coord"]
+                for name in field_names:
+                    value = cell.get(name)
+                    env.fields[name][i, j] = np.nan if value is None else value
+                env.fuel[i, j] = fuel_models.code_of(cell["fuel_type"])
+                env.fuel_rgb[i, j] = color_to_rgb(cell["fuel_type_color"])
+                env.original_fuel[i, j] = fuel_models.code_of(cell.get("original_fuel_type", cell["fuel_type"]))
+                env.original_rgb[i, j] = color_to_rgb(cell.get("original_color", cell["fuel_type_color"]))
+        return env
+
+    # Converts back to the old list-of-dicts layout.
+    def to_grid(self):
+        return [[dict(self[i][j]) for j in range(self.n)] for i in range(self.n)]
+
+    def copy(self):
+        env = Environment(self.coords.copy(), {k: v.copy() for k, v in self.fields.items()},
+                          self.fuel.copy(), self.fuel_rgb.copy(), self.date,
+                          self.original_fuel.copy(), self.original_rgb.copy(),
+                          self.forecast, self.forecast_times, self.forecast_fields)  # forecast is never edited in place
+        env.derived = dict(self.derived)
+        return env
+
+    def field(self, name, default):
+        values = self.fields.get(name)
+        if values is None:
+            return np.full((self.n, self.n), default, dtype=np.float32)
+        return np.where(np.isnan(values), np.float32(default), values)
+
+    @property
+    def forecast_hours(self):
+        return 0 if self.forecast is None else self.forecast.shape[0]
+
+    # Like field(), for forecast hour `hour`; falls back to the static field
+    # when the forecast does not include `name`.
+    def forecast_field(self, hour, name, default):
+        if name not in self.forecast_fields:
+            return self.field(name, default)
+        values = self.forecast[hour, :, :, self.forecast_fields.index(name)]
+        return np.where(np.isnan(values), np.float32(default), values)
+
+    @property
+    def elevation(self):
+        return self.field(ELEVATION, 0.0)
+
+    @property
+    def moisture(self):
+        return self.field(SOIL_MOISTURE, 0.1)
+
+    @property
+    def temperature(self):
+        return self.field(TEMPERATURE, 25.0)
+
+    @property
+    def wind_speed(self):
+        return self.field(WIND_SPEED, 5.0)
+
+    @property
+    def wind_direction(self):
+        return self.field(WIND_DIRECTION, 0.0)
+
+    @property
+    def nonburnable(self):
+        return fuel_models.NONBURNABLE[self.fuel]
+
+    # --- dict-style compatibility view: env[i][j]["fuel_type"] ---
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        if not -self.n <= i < self.n:
+            raise IndexError(i)
+        return _RowView(self, i % self.n)
+
+    def __iter__(self):
+        for i in range(self.n):
+            yield _RowView(self, i)
+
+
+# Loads anything grid-like (Environment or list-of-dicts) as an Environment.
+def as_environment(grid):
+    if isinstance(grid, Environment):
+        return grid
+    return Environment.from_grid(grid)
+
+
+class FirebreakOverlay:
+    """
+    Firebreak cells layered over a shared, read-only base Environment.
+
+    apply()/remove() only touch the firebreak's own cells (O(length)), so
+    candidates can be swapped without copying or reloading the grid. Cells
+    are reference counted so overlapping firebreaks can be removed in any order.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self.counts = np.zeros((env.n, env.n), dtype=np.int16)
+
+    def apply(self, cells):
+        for i, j in cells:
+            self.counts[i, j] += 1
+
+    def remove(self, cells):
+        for i, j in cells:
+            self.counts[i, j] -= 1
+
+    @property
+    def mask(self):
+        return self.counts > 0
+
+
+class _RowView:
+    def __init__(self, env, i):
+        self.env = env
+        self.i = i
+
+    def __len__(self):
+        return self.env.n
+
+    def __getitem__(self, j):
+        if not -self.env.n <= j < self.env.n:
+            raise IndexError(j)
+        return CellView(self.env, self.i, j % self.env.n)
+
+    def __iter__(self):
+        for j in range(self.env.n):
+            yield CellView(self.env, self.i, j)
+
+
+class CellView(MutableMapping):
+    def __init__(self, env, i, j):
+        self.env = env
+        self.i = i
+        self.j = j
+
+    def __getitem__(self, key):
+        env, i, j = self.env, self.i, self.j
+        if key == "central_coord":
+            return (env.coords[i, j, 0], env.coords[i, j, 1])
+        if key == "Date":
+            return env.date
+        if key == "fuel_type":
+            return fuel_models.name_of(env.fuel[i, j])
+        if key == "fuel_type_color":
+            return rgb_to_color(env.fuel_rgb[i, j])
+        if key == "original_fuel_type":
+            return fuel_models.name_of(env.original_fuel[i, j])
+        if key == "original_color":
+            return rgb_to_color(env.original_rgb[i, j])
+        value = env.fields[key][i, j]
+        return None if np.isnan(value) else value
+
+    def __setitem__(self, key, value):
+        env, i, j = self.env, self.i, self.j
+        if key == "central_coord":
+            env.coords[i, j] = value
+        elif key == "Date":
+            env.date = value
+        elif key == "fuel_type":
+            env.fuel[i, j] = fuel_models.code_of(value)
+        elif key == "fuel_type_color":
+            env.fuel_rgb[i, j] = color_to_rgb(value)
+        elif key == "original_fuel_type":
+            env.original_fuel[i, j] = fuel_models.code_of(value)
+        elif key == "original_color":
+            env.original_rgb[i, j] = color_to_rgb(value)
+        else:
+            if key not in env.fields:
+                env.fields[key] = np.full((env.n, env.n), np.nan, dtype=np.float32)
+            env.fields[key][i, j] = np.nan if value is None else value
+
+    def __delitem__(self, key):
+        raise TypeError("Environment cells have a fixed set of attributes")
+
+    def __iter__(self):
+        yield "central_coord"
+        yield "Date"
+        yield from self.env.fields
+        yield from CELL_META_KEYS[2:]
+
+    def __len__(self):
+        return len(self.env.fields) + len(CELL_META_KEYS)
+
+    def __repr__(self):
+        return repr(dict(self))
@@ -3,33 +3,70 @@ import random
 import math
 
 class Firebreak:
-    def __init__(self, grid, length_range=(10, 25), angles=[0, 45, 90, 135, 180, 225, 270, 315]):
+    # modify_grid=False leaves the grid untouched and only fills firebreak_mask /
+    # cells, so the firebreak can be layered over a shared environment
+    # (see environment.FirebreakOverlay).
+    # rng: optional numpy Generator for the random placement (default: random module).
+    def __init__(self, grid, length_range=(10, 25), angles=[0, 45, 90, 135, 180, 225, 270, 315], modify_grid=True,
+                 rng=None):
         self.grid = grid
+        self.rng = rng
         self.n = len(grid)
         self.length_range = length_range
         self.angles = angles
+        self.modify_grid = modify_grid
         self.firebreak_mask = np.zeros((self.n, self.n), dtype=bool)
         self.cells = []
         self.place_random_firebreak()
 
+    # Builds a firebreak with fixed parameters instead of a random placement.
+    @classmethod
+    def from_params(cls, grid, start_i, start_j, angle_deg, length, modify_grid=False):
+        fb = cls.__new__(cls)
+        fb.grid = grid
+        fb.rng = None
+        fb.n = len(grid)
+        fb.length_range = (length, length)
+        fb.angles = [angle_deg]
+        fb.modify_grid = modify_grid
+        fb.firebreak_mask = np.zeros((fb.n, fb.n), dtype=bool)
+        fb.cells = []
+        fb.start_i, fb.start_j, fb.angle_deg, fb.length = start_i, start_j, angle_deg, length
+        fb.apply_firebreak()
+        return fb
+
     def place_random_firebreak(self):
-        self.start_i = random.randint(0, self.n - 1)
-        self.start_j = random.randint(0, self.n - 1)
-        self.angle_deg = random.choice(self.angles)
-        self.length = random.randint(*self.length_range)
+        if self.rng is None:
+            self.start_i = random.randint(0, self.n - 1)
+            self.start_j = random.randint(0, self.n - 1)
+            self.angle_deg = random.choice(self.angles)
+            self.length = random.randint(*self.length_range)
+        else:
+            self.start_i = int(self.rng.integers(0, self.n))
+            self.start_j = int(self.rng.integers(0, self.n))
+            self.angle_deg = self.angles[int(self.rng.integers(len(self.angles)))]
+            self.length = int(self.rng.integers(self.length_range[0], self.length_range[1] + 1))
         self.apply_firebreak()
 
     def apply_firebreak(self):
-        angle_rad = math.radians(self.angle_deg)
-        step_i = int(round(np.sin(angle_rad)))
-        step_j = int(round(np.cos(angle_rad)))
-        i, j = self.start_i, self.start_j
-
-        for _ in range(self.length):
-            if 0 <= i < self.n and 0 <= j < self.n:
+        for i, j in rasterize_firebreak(self.n, self.start_i, self.start_j, self.angle_deg, self.length):
+            if self.modify_grid:
                 self.grid[i][j]['fuel_type'] = "NB"  # Non-burnable: triggers 0 ROS
                 self.grid[i][j]['fuel_type_color'] = "white"  # So it's visible in simulation
-                self.firebreak_mask[i][j] = True
-                self.cells.append((i, j))
-            i += step_i
-            j += step_j
+            self.firebreak_mask[i][j] = True
+            self.cells.append((i, j))
+
+# Cells covered by a straight firebreak on an n x n grid, clipped at the edges.
+def rasterize_firebreak(n, start_i, start_j, angle_deg, length):
+    angle_rad = math.radians(angle_deg)
+    step_i = int(round(np.sin(angle_rad)))
+    step_j = int(round(np.cos(angle_rad)))
+    i, j = start_i, start_j
+
+    cells = []
+    for _ in range(length):
+        if 0 <= i < n and 0 <= j < n:
+            cells.append((i, j))
+        i += step_i
+        j += step_j
+    return cells
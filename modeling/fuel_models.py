@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+
+# Integer lookup table for fuel model codes (Scott & Burgan 40 + non-burnable).
+# Environments store fuel types as indices into this tuple instead of strings,
+# so hot loops compare small integers rather than calling str.startswith().
+FUEL_CODES = (
+    "NB", "NB1", "NB2", "NB3", "NB8", "NB9",
+    "GR1", "GR2", "GR3", "GR4", "GR5", "GR6", "GR7", "GR8", "GR9",
+    "GS1", "GS2", "GS3", "GS4",
+    "SH1", "SH2", "SH3", "SH4", "SH5", "SH6", "SH7", "SH8", "SH9",
+    "TU1", "TU2", "TU3", "TU4", "TU5",
+    "TL1", "TL2", "TL3", "TL4", "TL5", "TL6", "TL7", "TL8", "TL9",
+    "SB1", "SB2", "SB3", "SB4",
+)
+FUEL_INDEX = {code: idx for idx, code in enumerate(FUEL_CODES)}
+
+# Code used when a cell is turned into a firebreak.
+FIREBREAK_CODE = FUEL_INDEX["NB"]
+
+# Boolean table: NONBURNABLE[code] is True for every "NB*" fuel model.
+NONBURNABLE = np.array([code.startswith("NB") for code in FUEL_CODES], dtype=bool)
+
+
+# Converts a fuel model string (e.g. "TU1") to its integer code.
+def code_of(fuel_type):
+    try:
+        return FUEL_INDEX[fuel_type]
+    except KeyError:
+        raise ValueError(f"Unknown fuel model code: {fuel_type!r}")
+
+
+# Converts an integer fuel code back to its fuel model string.
+def name_of(code):
+    return FUEL_CODES[int(code)]
+
+
+FUEL_MODEL_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_retrieval", "fuel_model_params.csv")
+
+# Groups whose live herbaceous load is transferred to dead fuel as it cures.
+CURING_GROUPS = ("GR", "GS", "SH")
+
+_fuel_model_params = None
+
+
+# Reads fuel model parameters from csv (parsed once per process).
+def load_fuel_model_params():
+    global _fuel_model_params
+    if _fuel_model_params is None:
+        import pandas as pd
+        _fuel_model_params = pd.read_csv(FUEL_MODEL_CSV, skiprows=1).rename(columns=lambda x: x.strip())
+    return _fuel_model_params
+
+
+class FuelTable:
+    """
+    Fuel model parameters compiled into NumPy columns indexed by integer fuel
+    code, so table[code_array] lookups replace per-cell DataFrame filtering.
+    Codes missing from the csv have defined[code] == False.
+    group_adjustments maps a fuel group prefix ("GR", "TU", ...) to its
+    spread multiplier.
+    """
+
+    def __init__(self, params, group_adjustments):
+        size = len(FUEL_CODES)
+        self.defined = np.zeros(size, dtype=bool)
+        self.load_1hr = np.zeros(size)
+        self.load_10hr = np.zeros(size)
+        self.load_100hr = np.zeros(size)
+        self.load_live_herb = np.zeros(size)
+        self.extinction_moisture = np.zeros(size)
+        self.sav_ratio = np.ones(size)
+        self.fuel_bed_depth = np.ones(size)
+        self.heat_content = np.full(size, 18000.0)
+        self.adjustment = np.array([group_adjustments.get(code[:2], 1.0) for code in FUEL_CODES])
+        self.cures = np.array([code[:2] in CURING_GROUPS for code in FUEL_CODES], dtype=bool)
+
+        for _, row in params.iterrows():
+            code = FUEL_INDEX.get(str(row["Fuel Model Code"]).strip())
+            if code is None:
+                continue
+            self.defined[code] = True
+            self.load_1hr[code] = row["Fuel Load (1-hr)"]
+            self.load_10hr[code] = row["Fuel Load (10-hr)"]
+            self.load_100hr[code] = row["Fuel Load (100-hr)"]
+            self.load_live_herb[code] = row["Fuel Load (Live herb)"]
+            self.extinction_moisture[code] = row["Dead Fuel Extincion Moisture Percent"]
+            self.sav_ratio[code] = row["SAV Ratio (Dead 1-hr)"]
+            self.fuel_bed_depth[code] = row["Fuel Bed Depth"]
+            if "Heat Content" in params.columns:
+                self.heat_content[code] = row["Heat Content"]
+
@@ -1,17 +1,33 @@
 import numpy as np
-import pickle
-import random
 import math
-import matplotlib.pyplot as plt
+import os
+import multiprocessing
 from firebreak_utils import Firebreak
-from fire_spread_sim_without_fb import run_fire_simulation_without_fb
-import fire_spread_sim
+import rothermel_model
+import env_store
+from burn_envelope import BurnEnvelope
+from environment import FirebreakOverlay
+from result_cache import CandidateCache, ResultCache
+from simulation import FireSimulation
+from spread_engine import STENCILS, CommonRandomNumbers, EnsembleResult
 
 # Constants
 GRID_SIZE = 30
 MAX_ITERS = 40
 INITIAL_TEMP = 1.0
 COOLING_RATE = 0.95
+ENGINE = "vectorized"  # "loop" for the reference per-cell engine
+ENSEMBLE_SIZE = 32  # Realizations per candidate; 1 = single noisy sample with retries
+WORKERS = 1  # > 1 scores a batch of WORKERS neighbors per step across a process pool
+SEED = None  # Set for reproducible runs (deterministic for a given seed and WORKERS)
+COMMON_RANDOM_NUMBERS = True  # Score every candidate under the same spread noise
+CACHE_BASELINE = True  # With a SEED, reuse the no-firebreak baseline from cached_grid_states/results
+RESUME = True  # Under common random numbers, re-simulate candidates only from where their edit is reached
+ENVELOPE_THRESHOLD = 0.0  # Candidates only on cells the baseline burns with at most this probability are not simulated
+BIAS_PROPOSALS = True  # Propose neighbors crossing the baseline's fire corridor more often
+CANDIDATE_CACHE_SIZE = 256  # Scored firebreak masks kept in memory (least recently used dropped first)
+MAX_REFINEMENTS = 4  # Without common random numbers, revisits add realizations up to this many ensembles
+MAX_RETRIES = 10  # Without common random numbers, fresh samples for a candidate whose fire did not spread
 
 def compute_unburned_area(state):
     return np.sum(state == 0)
@@ -42,143 +58,354 @@ def get_neighbors(params):
                     })
     return neighbors
 
+# Picks `size` distinct neighbors, with probability proportional to 1 + the
+# expected number of baseline-burning cells each crosses when an envelope is
+# given (so neighbors outside the fire stay possible), else uniformly.
+def propose_neighbors(neighbors, rng, size=1, envelope=None):
+    p = None
+    if envelope is not None:
+        weights = np.array([1.0 + envelope.weight(create_firebreak(params).cells) for params in neighbors])
+        p = weights / weights.sum()
+    picks = rng.choice(len(neighbors), size=min(size, len(neighbors)), replace=False, p=p)
+    return [neighbors[k] for k in picks]
+
+# Whether the fire of each realization spread: a run leaving nearly all of the
+# grid unburned, or burning little more than the firebreak itself, never got
+# away from the ignition and says nothing about the placement.
+def fire_spread(result, params):
+    burned = GRID_SIZE * GRID_SIZE - result.unburned
+    return (result.unburned <= 880) & (burned > params["length"] + 20)
+
+# Objective input of a candidate: the mean unburned area of the realizations
+# whose fire spread, or None if it spread in none of them (the candidate is
+# then retried or skipped).
+def spread_unburned(result, params):
+    spread = fire_spread(result, params)
+    return float(np.mean(result.unburned[spread])) if spread.any() else None
+
+# Simulations of a candidate whose fire did not spread: under common random
+# numbers a rerun would repeat the same run.
+def max_attempts(crn):
+    return 1 if crn is not None else MAX_RETRIES
+
+_base_grid = None
+_overlay = None
+_simulation = None
+
+# Loads saved_grid once as a read-only base environment; spread-model
+# inputs are precomputed on it and candidates are layered on top as masks,
+# all simulated by one FireSimulation.
+def load_base_grid():
+    global _base_grid, _overlay, _simulation
+    if _base_grid is None:
+        _base_grid = env_store.load_or_convert("saved_grid")
+        if _base_grid is None:
+            path = os.path.abspath("saved_grid")
+            raise FileNotFoundError(f"No base grid to optimize: neither {path}/ nor {path}.pkl exists "
+                                    "(run from the directory holding saved_grid)")
+        rothermel_model.get_inputs(_base_grid)
+        _base_grid.fuel.flags.writeable = False
+        _base_grid.fuel_rgb.flags.writeable = False
+        _overlay = FirebreakOverlay(_base_grid)
+        _simulation = FireSimulation(_base_grid, iterations=30, engine=ENGINE)
+    return _base_grid
+
+# Rasterizes a candidate without touching the base grid.
 def create_firebreak(params):
-    with open("saved_grid.pkl", "rb") as f:
-        temp_grid = pickle.load(f)
-
-    fb = Firebreak(temp_grid, length_range=(params["length"], params["length"]), angles=[params["angle"]])
-    fb.start_i = params["start_i"]
-    fb.start_j = params["start_j"]
-    fb.angle_deg = params["angle"]
-    fb.length = params["length"]
-    fb.firebreak_mask[:] = False
-    fb.cells.clear()
-    fb.apply_firebreak()
-    return temp_grid, fb
-
-def simulated_annealing():
+    return Firebreak.from_params(load_base_grid(), params["start_i"], params["start_j"],
+                                 params["angle"], params["length"])
+
+# Whether a candidate covers the ignition cell, so the fire could never start
+# (fire_spread_sim.default_grid keeps its random firebreak off it the same way).
+def blocks_ignition(params):
+    return bool(create_firebreak(params).firebreak_mask[_simulation.start])
+
+# Neighbors of a candidate that leave the ignition cell burnable.
+def candidate_neighbors(params):
+    return [neighbor for neighbor in get_neighbors(params) if not blocks_ignition(neighbor)]
+
+# Full grid copy with the firebreak burned in (for saving/visualizing results).
+def create_firebreak_grid(params):
+    grid = load_base_grid().copy()
+    grid.fuel.flags.writeable = True
+    grid.fuel_rgb.flags.writeable = True
+    fb = Firebreak.from_params(grid, params["start_i"], params["start_j"],
+                               params["angle"], params["length"], modify_grid=True)
+    return grid, fb
+
+# Scores a candidate on ENSEMBLE_SIZE realizations run as one batch, so the
+# objective is the mean unburned area rather than a single noisy sample.
+# rng is a numpy Generator or a shared CommonRandomNumbers source.
+# reference (optional, common random numbers only) is (firebreak mask,
+# recorded EnsembleResult) of an earlier candidate or the baseline: the
+# ensemble is then resumed from the last step before the fire reaches a cell
+# the edit changed, with the same result as a full run.
+def evaluate_ensemble(params, rng, reference=None):
+    fb = create_firebreak(params)
+    _overlay.apply(fb.cells)
+    if reference is not None:
+        result = _simulation.resume_ensemble(reference[1], reference[0], _overlay.mask, rng=rng)
+    else:
+        result = _simulation.ensemble(ENSEMBLE_SIZE, overlay_mask=_overlay.mask, rng=rng,
+                                      record=isinstance(rng, CommonRandomNumbers))
+    _overlay.remove(fb.cells)
+    return fb, result
+
+# Scores a candidate on one realization with the configured ENGINE, resumed
+# from reference like evaluate_ensemble, as a one-realization EnsembleResult.
+def evaluate_run(params, rng, reference=None):
+    fb = create_firebreak(params)
+    _overlay.apply(fb.cells)
+    if reference is not None:
+        state = _simulation.resume(reference[1].ignition_step[0], reference[0], _overlay.mask, rng=rng)
+    else:
+        state = _simulation.run(overlay_mask=_overlay.mask, rng=rng)
+    _overlay.remove(fb.cells)
+    return EnsembleResult(state[None], _simulation.ignition_step[None], _simulation.resume_step)
+
+# Pool worker: scores one candidate with its own random source, so the result
+# does not depend on which process runs it or in what order.
+def evaluate_candidate(args):
+    params, rng, reference = args
+    _, result = evaluate_ensemble(params, rng, reference)
+    return result
+
+# Realizations a cached candidate needs before revisits reuse it instead of
+# simulating more: under common random numbers a rerun would repeat it
+# exactly, otherwise it is refined up to MAX_REFINEMENTS ensembles.
+def settled_realizations(crn):
+    return 0 if crn is not None else MAX_REFINEMENTS * ENSEMBLE_SIZE
+
+# Reference to resume later candidates from once `params` is accepted with
+# `result`: the candidate's own run if it recorded ignition steps. A pruned
+# candidate scores as the baseline, which was simulated without its firebreak,
+# so the previous reference is kept.
+def accepted_reference(reference, params, result, baseline):
+    if result is baseline or result.ignition_step is None:
+        return reference
+    return create_firebreak(params).firebreak_mask, result
+
+# Scores a batch of distinct neighbors in parallel and returns the best one as
+# the SA proposal: (params, EnsembleResult, unburned area, firebreak_area,
+# candidates pruned, resumed steps, simulated steps), with params None if no
+# candidate's fire spread. Under common random numbers every candidate shares
+# crn (and is resumed from reference); otherwise each gets a Generator seeded
+# from the optimizer's rng, and candidates whose fire did not spread are
+# sampled again as in the serial search. Candidates outside the envelope score
+# as the baseline; those in the candidate cache are reused or refined, and
+# neighbors covering the same cells are simulated once. The step counts cover
+# every simulation in the batch.
+def evaluate_batch(pool, neighbors, batch_size, rng, crn, reference=None, envelope=None, baseline=None,
+                   candidates=None):
+    batch = propose_neighbors(neighbors, rng, batch_size, envelope if BIAS_PROPOSALS else None)
+    fbs = [create_firebreak(params) for params in batch]
+    results = [None] * len(batch)
+    simulate = {}  # mask bytes -> first neighbor covering those cells
+    pruned = 0
+    for k, fb in enumerate(fbs):
+        if envelope is not None and not envelope.reaches(fb.cells, STENCILS[_simulation.neighbors]):
+            results[k] = baseline
+            pruned += 1
+        elif candidates is not None and fb.firebreak_mask.tobytes() not in simulate:
+            results[k] = candidates.get(fb.firebreak_mask, settled_realizations(crn))
+        if results[k] is None:
+            simulate.setdefault(fb.firebreak_mask.tobytes(), k)
+
+    pending = list(simulate.values())
+    resumed_steps = simulated_steps = 0
+    for _ in range(max_attempts(crn)):
+        if not pending:
+            break
+        if crn is not None:
+            rngs = [crn] * len(pending)
+        else:
+            rngs = [np.random.default_rng(seed) for seed in rng.integers(2**32, size=len(pending))]
+        simulated = pool.map(evaluate_candidate, [(batch[k], rng_k, reference) for k, rng_k in zip(pending, rngs)])
+        for k, result in zip(pending, simulated):
+            results[k] = result
+            if reference is not None:
+                resumed_steps += result.start_step
+                simulated_steps += _simulation.iterations
+        pending = [k for k in pending if spread_unburned(results[k], batch[k]) is None]
+    for k in simulate.values():
+        if candidates is not None and k not in pending:
+            results[k] = candidates.add(fbs[k].firebreak_mask, results[k])
+    for k, fb in enumerate(fbs):
+        if results[k] is None:
+            results[k] = results[simulate[fb.firebreak_mask.tobytes()]]
+
+    max_area = GRID_SIZE * GRID_SIZE
+    areas = [compute_firebreak_area(fb.firebreak_mask) for fb in fbs]
+    unburned = [spread_unburned(result, params) for result, params in zip(results, batch)]
+    spread = [k for k in range(len(batch)) if unburned[k] is not None]
+    if not spread:
+        return None, None, None, None, pruned, resumed_steps, simulated_steps
+    best = max(spread, key=lambda k: objective(unburned[k], areas[k], max_area))
+    return batch[best], results[best], unburned[best], areas[best], pruned, resumed_steps, simulated_steps
+
+def simulated_annealing(workers=WORKERS, seed=SEED, common_random_numbers=COMMON_RANDOM_NUMBERS):
+    rng = np.random.default_rng(seed)
+    crn = CommonRandomNumbers(int(rng.integers(2**32))) if common_random_numbers else None
+
+    # Baseline: the same engine and parameters as the candidates with no
+    # firebreak, under the candidates' noise. It depends only on the grid,
+    # the parameters and the seed, so seeded runs load it from the cache.
     print("Loading saved grid...")
-    baseline_state = run_fire_simulation_without_fb(iterations=30, display=False)
-    baseline_unburned = compute_unburned_area(baseline_state)
+    load_base_grid()
+    cache = ResultCache() if CACHE_BASELINE and seed is not None else None
+    if crn is not None:
+        baseline_seed = crn.seed
+    else:
+        baseline_seed = seed if seed is not None else int(np.random.default_rng().integers(2**32))
+    baseline = _simulation.baseline(ENSEMBLE_SIZE, baseline_seed, crn is not None, cache)
+    baseline_unburned = baseline.mean_unburned
     max_possible = GRID_SIZE * GRID_SIZE
 
-    print(f"Baseline unburned area: {baseline_unburned}/{max_possible}")
+    cached = " (cached)" if cache is not None and cache.hits else ""
+    print(f"Baseline unburned area: {baseline_unburned:.1f}/{max_possible}{cached}")
     print("Starting Simulated Annealing...\n")
 
+    # Under common random numbers candidates are re-simulated from the run of
+    # the current solution (the baseline until a candidate is accepted), as
+    # each neighbor only moves the firebreak a little.
+    reference = None
+    if RESUME and crn is not None and baseline.ignition_step is not None:
+        reference = (None, baseline)
+    resumed_steps = simulated_steps = 0
+
+    # Burn envelope of the baseline: candidates entirely outside it cannot
+    # change the fire, and proposals favor neighbors crossing it.
+    envelope = BurnEnvelope(baseline.burn_probability, ENVELOPE_THRESHOLD)
+    print(f"Burn envelope covers {100 * envelope.coverage:.0f}% of the grid")
+    pruned_candidates = total_candidates = 0
+
+    # Scores of visited candidates by firebreak mask, for revisits.
+    candidates = CandidateCache(CANDIDATE_CACHE_SIZE)
+
     best_cost = -np.inf
     current_params = {
-        "start_i": random.randint(0, GRID_SIZE - 1),
-        "start_j": random.randint(0, GRID_SIZE - 1),
-        "angle": random.choice([0, 45, 90, 135, 180, 225, 270, 315]),
-        "length": random.randint(10, 25)
+        "start_i": int(rng.integers(0, GRID_SIZE)),
+        "start_j": int(rng.integers(0, GRID_SIZE)),
+        "angle": int(rng.choice([0, 45, 90, 135, 180, 225, 270, 315])),
+        "length": int(rng.integers(10, 26))
     }
 
     temp = INITIAL_TEMP
     best_params = None
-
-    for step in range(MAX_ITERS):
-        neighbors = get_neighbors(current_params)
-        new_params = random.choice(neighbors)
-
-        MAX_RETRIES = 10
-        retry_count = 0
-        new_unburned = GRID_SIZE * GRID_SIZE
-        new_state = None
-        new_fb = None
-        new_grid = None
-
-        while retry_count < MAX_RETRIES:
-            new_grid, new_fb = create_firebreak(new_params)
-            pickle.dump(new_grid, open("temp_grid.pkl", "wb"))
-            fire_spread_sim.grid = new_grid
-            new_state = fire_spread_sim.run_fire_simulation(iterations=30, display=False, reset=True)
-
-            new_unburned = compute_unburned_area(new_state)
-            new_burned = GRID_SIZE * GRID_SIZE - new_unburned
-            if new_unburned <= 880 and new_burned > new_params["length"] + 20:
-                break
-            retry_count += 1
-
-        if retry_count == MAX_RETRIES and new_unburned > 880:
-            print(f"[Step {step}]  Skipped: Fire did not spread after {MAX_RETRIES} retries (Unburned: {new_unburned})")
-            continue
-
-        new_area = compute_firebreak_area(new_fb.firebreak_mask)
-        new_cost = objective(new_unburned, new_area, max_possible)
-
-        cost_diff = new_cost - best_cost
-        accepted = False
-
-        if cost_diff > 0 or np.random.rand() < math.exp(cost_diff / temp):
-            current_params = new_params
-            accepted = True
-            if new_cost > best_cost:
-                best_cost = new_cost
-                best_params = new_params
-                with open("best_final_grid.pkl", "wb") as f:
-                    pickle.dump(new_grid, f)
-
-        status = "Accepted" if accepted else "Rejected"
-        print(f"[Step {step}] Temp: {temp:.4f} | Cost: {new_cost:.4f} | Best: {best_cost:.4f} | {status} "
-              f"| Start: ({new_params['start_i']},{new_params['start_j']}) | Len: {new_params['length']} | "
-              f"Angle: {new_params['angle']} | Unburned: {new_unburned}")
-
-        temp *= COOLING_RATE
+    pool = multiprocessing.Pool(workers, initializer=load_base_grid) if workers > 1 else None
+
+    # Worker processes are stopped if the search fails part way.
+    try:
+        for step in range(MAX_ITERS):
+            neighbors = candidate_neighbors(current_params)
+
+            result = None
+            if pool is not None:
+                new_params, result, new_unburned, new_area, batch_pruned, batch_resumed, batch_simulated = (
+                    evaluate_batch(pool, neighbors, workers, rng, crn, reference, envelope, baseline, candidates))
+                pruned_candidates += batch_pruned
+                total_candidates += min(workers, len(neighbors))
+                resumed_steps += batch_resumed
+                simulated_steps += batch_simulated
+                if new_params is None:
+                    print(f"[Step {step}]  Skipped: Fire did not spread for any of {min(workers, len(neighbors))} "
+                          f"neighbors after {max_attempts(crn)} attempts")
+                    continue
+            else:
+                new_params = propose_neighbors(neighbors, rng, envelope=envelope if BIAS_PROPOSALS else None)[0]
+                new_fb = create_firebreak(new_params)
+                new_area = compute_firebreak_area(new_fb.firebreak_mask)
+                pruned = not envelope.reaches(new_fb.cells, STENCILS[_simulation.neighbors])
+                pruned_candidates += pruned
+                total_candidates += 1
+                known = None if pruned else candidates.get(new_fb.firebreak_mask, settled_realizations(crn))
+
+                if pruned:
+                    # The fire never reaches this firebreak: the baseline, minus its area.
+                    result = baseline
+                elif known is not None:
+                    result = known
+                else:
+                    # Sampled again (with fresh noise) while the fire does not spread.
+                    for _ in range(max_attempts(crn)):
+                        if ENSEMBLE_SIZE > 1:
+                            _, result = evaluate_ensemble(new_params, crn if crn is not None else rng, reference)
+                        else:
+                            result = evaluate_run(new_params, crn if crn is not None else rng, reference)
+                        if reference is not None:
+                            resumed_steps += result.start_step
+                            simulated_steps += _simulation.iterations
+                        if spread_unburned(result, new_params) is not None:
+                            break
+                new_unburned = spread_unburned(result, new_params)
+                if new_unburned is None:
+                    print(f"[Step {step}]  Skipped: Fire did not spread after {max_attempts(crn)} attempts")
+                    continue
+                if not pruned and known is None:
+                    result = candidates.add(new_fb.firebreak_mask, result)
+                    new_unburned = spread_unburned(result, new_params)
+
+            new_cost = objective(new_unburned, new_area, max_possible)
+
+            cost_diff = new_cost - best_cost
+            accepted = False
+
+            if cost_diff > 0 or rng.random() < math.exp(cost_diff / temp):
+                current_params = new_params
+                accepted = True
+                if RESUME and crn is not None:
+                    reference = accepted_reference(reference, new_params, result, baseline)
+                if new_cost > best_cost:
+                    best_cost = new_cost
+                    best_params = new_params
+                    new_grid, _ = create_firebreak_grid(new_params)
+                    env_store.save_environment(new_grid, "best_final_grid")
+
+            status = "Accepted" if accepted else "Rejected"
+            print(f"[Step {step}] Temp: {temp:.4f} | Cost: {new_cost:.4f} | Best: {best_cost:.4f} | {status} "
+                  f"| Start: ({new_params['start_i']},{new_params['start_j']}) | Len: {new_params['length']} | "
+                  f"Angle: {new_params['angle']} | Unburned: {new_unburned:.1f}")
+
+            temp *= COOLING_RATE
+    except BaseException:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        raise
+
+    if pool is not None:
+        pool.close()
+        pool.join()
 
     print("\nOptimization complete!")
+    if total_candidates:
+        print(f"Burn envelope pruned {pruned_candidates}/{total_candidates} candidate simulations "
+              f"({100 * pruned_candidates / total_candidates:.0f}%)")
+    lookups = candidates.hits + candidates.misses
+    print(f"Candidate cache: {candidates.hits}/{lookups} lookups hit ({100 * candidates.hit_rate:.0f}%), "
+          f"{len(candidates.entries)} firebreaks cached")
+    if simulated_steps:
+        print(f"Resumed candidates reused {resumed_steps}/{simulated_steps} simulated steps "
+              f"({100 * resumed_steps / simulated_steps:.0f}%)")
     if best_params:
         print(f"Best Firebreak Params: {best_params}")
         visualize_best_firebreak_on_clean_grid(best_params)
 
 #  Visualize firebreak-only on clean grid
 def visualize_best_firebreak_on_clean_grid(best_params):
-    with open("saved_grid.pkl", "rb") as f:
-        clean_grid = pickle.load(f)
-
-    # Initialize without placing random firebreak
-    fb = Firebreak(clean_grid, length_range=(best_params["length"], best_params["length"]), angles=[best_params["angle"]])
-
-    # Overwrite with best SA values
-    fb.start_i = best_params["start_i"]
-    fb.start_j = best_params["start_j"]
-    fb.angle_deg = best_params["angle"]
-    fb.length = best_params["length"]
-
-    # Clear mask and reapply firebreak with new settings
-    fb.firebreak_mask[:] = False
-    fb.cells.clear()
-    fb.apply_firebreak()  # This must be called AFTER updating the params
+    # Best firebreak as a mask over the shared base grid (left unmodified)
+    clean_grid = load_base_grid()
+    fb = create_firebreak(best_params)
 
     firebreak_mask = fb.firebreak_mask
 
     # Plot grid with only the best firebreak
-    fig, ax = plt.subplots(figsize=(8, 8))
-    color_matrix = np.empty((GRID_SIZE, GRID_SIZE), dtype=object)
-
-    for i in range(GRID_SIZE):
-        for j in range(GRID_SIZE):
-            if firebreak_mask[i][j]:
-                color_matrix[i, j] = "white"
-            else:
-                color_matrix[i, j] = clean_grid[i][j]["fuel_type_color"]
-
-    ax.set_xlim(0, GRID_SIZE)
-    ax.set_ylim(0, GRID_SIZE)
-    ax.set_xticks([])
-    ax.set_yticks([])
-    ax.set_aspect('equal')
-    ax.set_title("Best Firebreak Placement Only")
-
-    for i in range(GRID_SIZE):
-        for j in range(GRID_SIZE):
-            ax.add_patch(
-                plt.Rectangle((j, GRID_SIZE - i - 1), 1, 1,
-                              facecolor=color_matrix[i, j], edgecolor='black')
-            )
-
-    plt.tight_layout()
+    import matplotlib.pyplot as plt
+    import render
+    viewer = render.FireRenderer(clean_grid.fuel_rgb, firebreak_mask, title="Best Firebreak Placement Only")
+    viewer.fig.tight_layout()
     plt.show()
-    plt.close(fig)
+    plt.close(viewer.fig)
 
 if __name__ == "__main__":
     simulated_annealing()
@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+from matplotlib.figure import Figure
+
+import spread_engine
+
+# Display color of each overlay layer, indexed by layer code: the fire states
+# (spread_engine.UNBURNED shows the fuel color underneath), then firebreaks.
+FIREBREAK_LAYER = 3
+LAYER_RGB = np.zeros((4, 3), dtype=np.uint8)
+LAYER_RGB[spread_engine.BURNING] = (255, 0, 0)
+LAYER_RGB[spread_engine.BURNED] = (0, 0, 0)
+LAYER_RGB[FIREBREAK_LAYER] = (255, 255, 255)
+
+
+# RGB image (n, n, 3) uint8 of a fire state over the fuel colors. Cell (i, j)
+# is pixel (i, j), so row 0 is drawn at the top as in the old patch plots.
+# Firebreak cells are drawn white whatever their fire state.
+def frame_rgb(fuel_rgb, fire_state=None, firebreak_mask=None):
+    layer = np.zeros(fuel_rgb.shape[:2], dtype=np.uint8)
+    if fire_state is not None:
+        layer[:] = np.asarray(fire_state, dtype=np.uint8)
+    if firebreak_mask is not None:
+        layer[firebreak_mask] = FIREBREAK_LAYER
+    return np.where(layer[..., None] > 0, LAYER_RGB[layer], fuel_rgb)
+
+
+class FireRenderer:
+    """
+    Draws fire states as one RGB image through a single imshow artist that is
+    updated in place each frame.
+
+    Without `output` frames go to an interactive pyplot window, pausing
+    `interval` seconds after each. With `output` rendering is headless
+    (an Agg figure, no window, no pause) and every frame is written out:
+    "*.gif" (Pillow) or "*.mp4" (ffmpeg) as an animation at `fps`, or a
+    PNG pattern such as "frames/step_{:03d}.png". Call close() to finish
+    the file.
+    """
+
+    def __init__(self, fuel_rgb, firebreak_mask=None, title="Fire Spread Simulation", output=None,
+                 interval=0.5, fps=4, dpi=100):
+        self.fuel_rgb = fuel_rgb
+        self.firebreak_mask = firebreak_mask
+        self.output = output
+        self.interval = interval
+        self.frames = 0
+
+        if output is None:
+            import matplotlib.pyplot as plt
+            self.plt = plt
+            self.fig = plt.figure(figsize=(8, 8))
+        else:
+            self.plt = None
+            self.fig = Figure(figsize=(8, 8), dpi=dpi)
+        ax = self.fig.add_subplot()
+        ax.set_title(title)
+        ax.set_xticks([])
+        ax.set_yticks([])
+        self.image = ax.imshow(frame_rgb(fuel_rgb, None, firebreak_mask), interpolation="nearest")
+
+        self.writer = None
+        if output is not None and not output.endswith(".png"):
+            from matplotlib import animation
+            writer_class = animation.PillowWriter if output.endswith(".gif") else animation.FFMpegWriter
+            self.writer = writer_class(fps=fps)
+            self.writer.setup(self.fig, output, dpi=dpi)
+
+    # Draws one fire state and writes or displays it.
+    def show(self, fire_state):
+        self.image.set_data(frame_rgb(self.fuel_rgb, fire_state, self.firebreak_mask))
+        if self.writer is not None:
+            self.writer.grab_frame()
+        elif self.output is not None:
+            path = self.output.format(self.frames)
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.fig.savefig(path)
+        else:
+            self.fig.canvas.draw_idle()
+            self.plt.pause(self.interval)
+        self.frames += 1
+
+    # Finishes the animation file (no-op for the interactive window).
+    def close(self):
+        if self.writer is not None:
+            self.writer.finish()
+            self.writer = None
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from environment import as_environment
+
+# Simulation results live next to the saved grid states, one .npz per key.
+RESULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cached_grid_states", "results")
+
+
+# Content hash of everything the spread model reads from an environment: cell
+# centers, fuels, weather fields, forecast and fetch date. Two environments
+# with the same hash give the same simulation results.
+def environment_hash(env):
+    env = as_environment(env)
+    digest = hashlib.sha256()
+
+    def add(array):
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(array.data)
+
+    for array in (env.coords, env.fuel, env.original_fuel):
+        add(array)
+    for name in sorted(env.fields):
+        digest.update(name.encode())
+        add(env.fields[name])
+    if env.forecast is not None:
+        add(env.forecast)
+        add(np.asarray(env.forecast_times, dtype=np.int64))
+        digest.update(json.dumps(list(env.forecast_fields)).encode())
+    digest.update(str(env.date).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    On-disk cache of simulation results keyed on (environment hash,
+    parameters): each entry is a dict of arrays saved as one .npz file.
+    Parameters must be JSON-serializable (they are hashed in sorted-key
+    order). Files are written to a temporary name and renamed, so processes
+    sharing the directory never read a partial entry. hits / misses count
+    lookups made through this instance.
+    """
+
+    def __init__(self, cache_dir=RESULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, env, params):
+        text = json.dumps({"environment": environment_hash(env), "params": params}, sort_keys=True)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    # Cached arrays for key, or None.
+    def get(self, key):
+        path = self.path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        with np.load(path) as stored:
+            arrays = {name: stored[name] for name in stored.files}
+        self.hits += 1
+        return arrays
+
+    def put(self, key, arrays):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, path)
+
+
+class CandidateCache:
+    """
+    Bounded in-memory LRU cache of scored firebreak candidates, keyed on the
+    rasterized firebreak mask, so parameter tuples that cover the same cells
+    (e.g. lines clipped at the grid edge) share an entry. Entries are
+    spread_engine.EnsembleResults; add() refines an existing entry by pooling
+    new realizations into it rather than replacing it. hits / misses count
+    get() calls.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, mask):
+        return mask.shape, np.packbits(mask).tobytes()
+
+    # Cached result for mask (marked most recently used), or None if there is
+    # none or it pools fewer than min_realizations realizations.
+    def get(self, mask, min_realizations=0):
+        result = self.entries.get(self.key(mask))
+        if result is None or result.realizations < min_realizations:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(self.key(mask))
+        self.hits += 1
+        return result
+
+    # Stores result for mask, pooled with any cached realizations, evicting
+    # the least recently used entry when full. Returns the stored result.
+    def add(self, mask, result):
+        key = self.key(mask)
+        if key in self.entries:
+            result = self.entries[key].pooled(result)
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return result
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -1,13 +1,10 @@
-import pandas as pd
 import numpy as np
+import environment
+import fuel_models
 from data_retrieval import open_meteo_client
-from data_retrieval import google_earth_segmentation
 
 CSV_LOG_FILE = "ros_results.csv"
 
-# Reads fuel model parameters from csv
-fuel_model_params = pd.read_csv("./data_retrieval/fuel_model_params.csv", skiprows=1).rename(columns=lambda x: x.strip())
-
 # Fire spread constants -> fire spread adjustments for different fuel types
 fuel_type_adjustments = {
     "GR": 1.2,  # Grass fires spread faster
@@ -20,6 +17,16 @@ fuel_type_adjustments = {
     "UNKNOWN": 0.0
 }
 
+# Fuel parameters as NumPy columns indexed by fuel code (for calculate_ros_array),
+# compiled from the fuel model csv on first use.
+fuel_table = None
+
+def get_fuel_table():
+    global fuel_table
+    if fuel_table is None:
+        fuel_table = fuel_models.FuelTable(fuel_models.load_fuel_model_params(), fuel_type_adjustments)
+    return fuel_table
+
 def get_live_fuel_moisture(location):
     data = open_meteo_client.get_attributes_by_location(location)
     # Use soil moisture in the top layer (0–10 cm)
@@ -52,7 +59,130 @@ def get_environmental_data(location):
 
     return elevation, elevation2, moisture, temperature, wind_speed, slope, live_fuel_moisture
 
-# Calculates slope using elevation difference over a set horizontal distance (default 500m)
+# Vectorized get_live_fuel_moisture over arrays of soil moisture and temperature.
+def live_fuel_moisture_array(soil_moisture, temperature):
+    lfmc = 30 + 100 * soil_moisture
+    lfmc = np.where(temperature > 25, lfmc - (temperature - 25) * 1.5, lfmc)
+    return np.clip(lfmc, 30, 120)
+
+# North-south and east-west cell spacing in meters. Cell centers are laid out
+# by build_env.get_step_size, so the spacing is recovered from the coordinates
+# of neighboring cells (rows run south to north, columns west to east).
+def cell_spacing(coords):
+    lat_step = coords[1, 0, 0] - coords[0, 0, 0]
+    lon_step = coords[0, 1, 1] - coords[0, 0, 1]
+    center_lat = coords[..., 0].mean()
+    return lat_step * 111000, lon_step * 111000 * np.cos(np.radians(center_lat))
+
+# Slope (percent) and aspect (degrees clockwise from north, the direction the
+# terrain faces, i.e. downslope) of every cell, from central finite differences
+# of the elevation raster (one-sided at the edges).
+def slope_aspect(elevation, coords):
+    n = elevation.shape[0]
+    if n < 2:
+        return np.zeros_like(elevation, dtype=np.float32), np.zeros_like(elevation, dtype=np.float32)
+    dy, dx = cell_spacing(coords)
+    dz_north, dz_east = np.gradient(elevation.astype(np.float64), dy, dx)
+    slope = 100 * np.hypot(dz_north, dz_east)
+    aspect = np.degrees(np.arctan2(-dz_east, -dz_north)) % 360
+    return slope.astype(np.float32), aspect.astype(np.float32)
+
+# Derives every spread-model input for all cells of an environment in one pass,
+# from what build_grid already stored on the grid (no extra API requests).
+# ROS is computed for the build-time fuel; callers zero it where the current
+# fuel is non-burnable (e.g. firebreaks).
+def precompute_inputs(env):
+    elevation = env.elevation
+    slope, aspect = slope_aspect(elevation, env.coords)
+
+    moisture = env.moisture
+    temperature = env.temperature
+    wind_speed = env.wind_speed
+    wind_direction = env.wind_direction
+    live_fuel_moisture = live_fuel_moisture_array(env.field(environment.SOIL_MOISTURE, 0.25),
+                                                  env.field(environment.TEMPERATURE, 20.0))
+
+    ros, _ = calculate_ros_array(env.original_fuel, wind_speed, slope, moisture, live_fuel_moisture)
+
+    return {
+        "elevation": elevation,
+        "moisture": moisture,
+        "temperature": temperature,
+        "wind_speed": wind_speed,
+        "wind_direction": wind_direction,
+        "slope": slope,
+        "aspect": aspect,
+        "live_fuel_moisture": live_fuel_moisture,
+        "ros": ros,
+    }
+
+# Returns the precomputed inputs of an environment, computing them on first use
+# (once per environment and weather snapshot).
+def get_inputs(env):
+    key = ("rothermel_inputs", env.date)
+    if key not in env.derived:
+        env.derived[key] = precompute_inputs(env)
+    return env.derived[key]
+
+class HourlyInputs:
+    """
+    Spread-model inputs that follow the environment's hourly forecast as a
+    simulation advances. Step t is at t * step_minutes after env.date; when
+    that crosses into a new forecast hour, the weather-dependent inputs are
+    replaced by that hour's values and ROS is recomputed only for the cells
+    whose weather changed (slope and fuel are reused). Past the end of the
+    forecast the last hour is kept. Without a forecast the static inputs are
+    returned for every step.
+    """
+
+    def __init__(self, env, step_minutes):
+        self.env = env
+        self.step_minutes = step_minutes
+        self.hour = 0
+        self.inputs = get_inputs(env)
+        self.cells_updated = 0
+        self.derived = {}
+
+    # Inputs for simulation step t. A new dict is returned only when the hour changes.
+    def at_step(self, t):
+        hour = min(int(t * self.step_minutes // 60), max(self.env.forecast_hours - 1, 0))
+        if hour != self.hour:
+            self.inputs = self.advance(hour)
+            self.hour = hour
+        return self.inputs
+
+    # fn(inputs) for step t, cached under `name` until the hour changes
+    # (e.g. the masked ROS field or per-direction spread weights).
+    def derive(self, t, name, fn):
+        inputs = self.at_step(t)
+        cached = self.derived.get(name)
+        if cached is None or cached[0] is not inputs:
+            cached = self.derived[name] = (inputs, fn(inputs))
+        return cached[1]
+
+    def advance(self, hour):
+        env, previous = self.env, self.inputs
+        inputs = dict(previous)
+        inputs["moisture"] = env.forecast_field(hour, environment.SOIL_MOISTURE, 0.1)
+        inputs["temperature"] = env.forecast_field(hour, environment.TEMPERATURE, 25.0)
+        inputs["wind_speed"] = env.forecast_field(hour, environment.WIND_SPEED, 5.0)
+        inputs["wind_direction"] = env.forecast_field(hour, environment.WIND_DIRECTION, 0.0)
+        inputs["live_fuel_moisture"] = live_fuel_moisture_array(
+            env.forecast_field(hour, environment.SOIL_MOISTURE, 0.25),
+            env.forecast_field(hour, environment.TEMPERATURE, 20.0))
+
+        changed = ((inputs["moisture"] != previous["moisture"]) | (inputs["wind_speed"] != previous["wind_speed"])
+                   | (inputs["live_fuel_moisture"] != previous["live_fuel_moisture"]))
+        if changed.any():
+            inputs["ros"] = previous["ros"].copy()
+            inputs["ros"][changed], _ = calculate_ros_array(
+                env.original_fuel[changed], inputs["wind_speed"][changed], inputs["slope"][changed],
+                inputs["moisture"][changed], inputs["live_fuel_moisture"][changed])
+            self.cells_updated += int(changed.sum())
+        return inputs
+
+# Calculates slope using elevation difference over a set horizontal distance (default 500m).
+# Single-location fallback for get_environmental_data; grids use slope_aspect.
 def calculate_slope(elevation, elevation2, distance=500):
     slope = ((elevation2 - elevation) / distance) * 100
     return abs(slope)  # Return percentage
@@ -128,7 +258,7 @@ def calculate_ros(fuel_type, wind_speed, slope, moisture, live_fuel_moisture, fu
     
     # Wind and slope factor
     phi_wind = 0.4 * (wind_speed / sigma) ** 2
-    phi_slope = 5.275 * (np.tan(np.radians(slope))) ** 1.35
+    phi_slope = 5.275 * (slope / 100) ** 1.35  # slope is in percent, i.e. 100 * tan(angle)
 
     # Dynamically Calculate Bulk Density
     reaction_intensity = h * (w_0 + 0.5 * w_10 + 0.2 * w_100) * (1 - moisture)
@@ -153,6 +283,50 @@ def calculate_ros(fuel_type, wind_speed, slope, moisture, live_fuel_moisture, fu
         "status_code": 1 # Fire will spread
     }
 
+# Vectorized calculate_ros over whole arrays of cells.
+# fuel_code is an integer array of fuel_models codes; the other arguments are
+# arrays (or scalars) broadcastable to it. Returns (ros, status_code) arrays
+# with the same rules as calculate_ros.
+def calculate_ros_array(fuel_code, wind_speed, slope, moisture, live_fuel_moisture, table=None):
+    if table is None:
+        table = get_fuel_table()
+    fuel_code = np.asarray(fuel_code)
+    nonburnable = fuel_models.NONBURNABLE[fuel_code]
+
+    if not np.all(table.defined[fuel_code] | nonburnable):
+        raise ValueError("Fuel type not found in dataset.")
+
+    live_fuel_moisture = np.asarray(live_fuel_moisture, dtype=np.float64)
+    transfer_ratio = np.select(
+        [live_fuel_moisture >= 120, live_fuel_moisture >= 90, live_fuel_moisture >= 75, live_fuel_moisture >= 60],
+        [0.0, 0.33, 0.50, 0.67],
+        default=1.0,
+    )
+    transfer_ratio = np.where(table.cures[fuel_code], transfer_ratio, 1.0)
+
+    w_0 = table.load_1hr[fuel_code] + table.load_live_herb[fuel_code] * transfer_ratio
+    w_10 = table.load_10hr[fuel_code]
+    w_100 = table.load_100hr[fuel_code]
+    sigma = table.sav_ratio[fuel_code]
+
+    # Wind and slope factor
+    phi_wind = 0.4 * (wind_speed / sigma) ** 2
+    phi_slope = 5.275 * (slope / 100) ** 1.35  # slope is in percent, i.e. 100 * tan(angle)
+
+    reaction_intensity = table.heat_content[fuel_code] * (w_0 + 0.5 * w_10 + 0.2 * w_100) * (1 - moisture)
+    rho_b = (w_0 + w_10 + w_100) / table.fuel_bed_depth[fuel_code]
+    PARTICLE_DENSITY = 512  # kg/m^3
+    beta = np.maximum(rho_b / PARTICLE_DENSITY, 1e-4)
+
+    ros = (reaction_intensity * (1 + phi_wind + phi_slope)) / (beta * sigma)
+    ros *= np.exp(-0.1 * (live_fuel_moisture - 30))
+    ros *= table.adjustment[fuel_code]
+
+    # Fire won't spread: non-burnable, moisture too high, or too slow
+    spreads = ~nonburnable & ~(moisture > table.extinction_moisture[fuel_code]) & ~(ros < 25)
+    ros = np.where(spreads, ros, 0.0)
+    return ros, spreads.astype(np.int8)
+
 # Test it
 # location = (41.0, -106.0)
 # location = (34.0549, -118.2426)  # coordinates input
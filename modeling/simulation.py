@@ -0,0 +1,350 @@
+import numpy as np
+
+import rothermel_model, spread_engine, travel_time
+from environment import as_environment
+
+# Default spread parameters (those of fire_spread_sim).
+INITIAL_INTENSITY = 1.0
+DECAY_RATE = 0.02
+MAX_ROS = 100.0  # Max ROS for scaling probabilities
+STEP_MINUTES = 10  # Simulated time per iteration, for following the hourly forecast
+ITERATIONS = 30
+
+
+# Adjust Rate of Spread when fire enters firebreak
+
+def adjust_ros_with_firebreak(i, j, ros, firebreak_mask, fire_intensity, wind_speed, slope, min_width=2):
+    """
+    Reduce ROS at (i, j) if there's a firebreak, considering:
+    - Firebreak width (surrounding cells)
+    - Wind speed
+    - Slope
+    """
+    if not firebreak_mask[i][j]:
+        return ros
+
+    # Width of the firebreak in 4-neighbor directions
+    directions = [(-1,0), (1,0), (0,-1), (0,1)]
+    width_count = 1
+    for di, dj in directions:
+        ni, nj = i + di, j + dj
+        if 0 <= ni < firebreak_mask.shape[0] and 0 <= nj < firebreak_mask.shape[1]:
+            if firebreak_mask[ni][nj]:
+                width_count += 1
+
+    # === Slope impact ===
+    if slope >= 20:
+        slope_factor = 0.7  # Steep slope → firebreak less effective
+    elif slope >= 10:
+        slope_factor = 0.4
+    else:
+        slope_factor = 0.2  # Flatter = more effective
+
+    # === Slope impact ===
+    if wind_speed > 15:
+        wind_factor = 0.6
+    elif wind_speed > 8:
+        wind_factor = 0.3
+    else:
+        wind_factor = 0.1
+
+    # Total reduction factor combines slope, wind, and firebreak width
+    base_reduction = min(1.0, (width_count / (min_width + 1)))
+    total_reduction = 1.0 - (base_reduction * (1 - slope_factor) * (1 - wind_factor))
+
+    return ros * total_reduction
+
+
+class FireSimulation:
+    """
+    Fire spread over one environment, with every parameter and random source
+    passed in explicitly instead of read from module globals, so several
+    environments can be simulated side by side in one process.
+
+    The run state (state, intensity, the step count t and the step at which
+    every cell ignited) lives on the object: run(reset=False) continues from
+    where the last run stopped, and resume() restarts a recorded run after a
+    firebreak edit from the last step the edit cannot have changed.
+    Candidate firebreaks are passed as overlay masks; the environment itself
+    is never modified.
+
+    engines ("vectorized" by default):
+      "loop"        per-cell reference implementation
+      "vectorized"  whole-grid array steps (spread_engine.step)
+      "frontier"    only the burning cells while the fire is small (spread_engine.run_frontier)
+    neighbors=8 or 16 (vectorized/frontier) spreads anisotropically with wind
+    and slope; 4 is the original isotropic model. hourly_weather follows the
+    environment's hourly forecast, step_minutes per step.
+    rng is a numpy Generator or a spread_engine.CommonRandomNumbers source.
+    """
+
+    def __init__(self, env, start=None, iterations=ITERATIONS, initial_intensity=INITIAL_INTENSITY,
+                 decay_rate=DECAY_RATE, max_ros=MAX_ROS, step_minutes=STEP_MINUTES, hourly_weather=True,
+                 neighbors=4, engine="vectorized", rng=None):
+        if neighbors not in spread_engine.STENCILS:
+            raise ValueError(f"neighbors must be one of {sorted(spread_engine.STENCILS)}, not {neighbors}")
+        self.env = as_environment(env)
+        self.n = self.env.n
+        self.start = (self.n // 2, self.n // 2) if start is None else tuple(start)
+        self.iterations = iterations
+        self.initial_intensity = initial_intensity
+        self.decay_rate = decay_rate
+        self.max_ros = max_ros
+        self.step_minutes = step_minutes if hourly_weather else 0
+        self.neighbors = neighbors
+        self.engine = engine
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.reset()
+
+    # Back to the initial state: only the start cell burning, full intensity.
+    def reset(self):
+        self.state = np.zeros((self.n, self.n), dtype=np.int8)
+        self.state[self.start] = spread_engine.BURNING
+        self.intensity = self.initial_intensity
+        self.t = 0
+        self.ignition_step = spread_engine.new_ignition_step((self.n, self.n), self.start)
+        self.resume_step = 0
+
+    def burnable(self, overlay_mask=None):
+        burnable = ~self.env.nonburnable
+        if overlay_mask is not None:
+            burnable &= ~overlay_mask
+        return burnable
+
+    # Per-step ROS field (0 where nothing can burn) and per-direction spread
+    # weights (None for the isotropic 4-neighbor model), recomputed only when
+    # the hourly weather changes. hourly steps every step_minutes (60 for
+    # one step per forecast hour).
+    def spread_fields(self, burnable, step_minutes=None):
+        step_minutes = self.step_minutes if step_minutes is None else step_minutes
+        hourly = rothermel_model.HourlyInputs(self.env, step_minutes)
+        directions = spread_engine.STENCILS[self.neighbors]
+
+        def ros_at(t):
+            # Firebreak and other non-burnable cells never spread.
+            return hourly.derive(t, "ros", lambda inputs: np.where(burnable, inputs["ros"], 0.0))
+
+        def weights_at(t):
+            if self.neighbors == 4:
+                return None
+            return hourly.derive(t, "weights", lambda inputs: spread_engine.direction_weights(
+                directions, inputs["wind_speed"], inputs["wind_direction"], inputs["slope"], inputs["aspect"]))
+
+        return hourly, ros_at, weights_at
+
+    # Advances the fire `iterations` steps (stopping early once nothing burns)
+    # and returns the state, an int8 array of spread_engine.UNBURNED/BURNING/BURNED.
+    # overlay_mask marks firebreak cells layered over the environment.
+    # renderer (optional, see render.FireRenderer) is shown every step.
+    def run(self, iterations=None, overlay_mask=None, engine=None, rng=None, reset=True, renderer=None):
+        iterations = self.iterations if iterations is None else iterations
+        engine = self.engine if engine is None else engine
+        rng = self.rng if rng is None else rng
+        if reset:
+            self.reset()
+        burnable = self.burnable(overlay_mask)
+
+        if engine == "vectorized":
+            self._run_vectorized(iterations, burnable, rng, renderer)
+        elif engine == "frontier":
+            self._run_frontier(iterations, burnable, rng, renderer)
+        elif engine == "loop":
+            if self.neighbors != 4:
+                raise ValueError("Anisotropic spread needs engine=\"vectorized\"")
+            if isinstance(rng, spread_engine.CommonRandomNumbers):
+                raise ValueError("Common random numbers need engine=\"vectorized\"")
+            self._run_loop(iterations, burnable, overlay_mask, rng, renderer)
+        else:
+            raise ValueError(f"Unknown engine: {engine!r}")
+        return self.state
+
+    def _run_loop(self, iterations, burnable, firebreak_mask, rng, renderer):
+        n = self.n
+        if firebreak_mask is None:
+            firebreak_mask = np.zeros((n, n), dtype=bool)
+        hourly, _, _ = self.spread_fields(burnable)
+
+        for _ in range(iterations):
+            new_state = self.state.copy()
+            inputs = hourly.at_step(self.t)
+
+            for i in range(n):
+                for j in range(n):
+                    if self.state[i, j] == spread_engine.BURNING:
+                        new_state[i, j] = spread_engine.BURNED
+                        ros = 0.0
+                        if burnable[i, j]:
+                            ros = adjust_ros_with_firebreak(i, j, inputs["ros"][i, j], firebreak_mask, self.intensity,
+                                                            inputs["wind_speed"][i, j], inputs["slope"][i, j])
+                        prob = min((ros * self.intensity) / self.max_ros, 1.0)
+
+                        for di, dj in spread_engine.DIRECTIONS_4:
+                            ni, nj = i + di, j + dj
+                            if 0 <= ni < n and 0 <= nj < n:
+                                if burnable[ni, nj] and self.state[ni, nj] == spread_engine.UNBURNED and rng.random() < prob:
+                                    new_state[ni, nj] = spread_engine.BURNING
+
+            ignite = (new_state == spread_engine.BURNING) & (self.state == spread_engine.UNBURNED)
+            self.ignition_step[ignite] = self.t + 1
+            self.state = new_state
+            self._advance(1, renderer)
+
+    def _run_vectorized(self, iterations, burnable, rng, renderer):
+        _, ros_at, weights_at = self.spread_fields(burnable)
+        directions = spread_engine.STENCILS[self.neighbors]
+        passable = spread_engine.passability(burnable, directions)
+
+        for _ in range(iterations):
+            if not np.any(self.state == spread_engine.BURNING):
+                break
+            spread_prob = spread_engine.spread_probability(ros_at(self.t), self.intensity, self.max_ros)
+            ignite = spread_engine.step(self.state, spread_prob, burnable,
+                                        spread_engine.uniform_draws(rng, self.t, (self.n, self.n)), directions,
+                                        weights_at(self.t), passable)
+            self.ignition_step[ignite] = self.t + 1
+            self._advance(1, renderer)
+
+    def _run_frontier(self, iterations, burnable, rng, renderer):
+        _, ros_at, weights_at = self.spread_fields(burnable)
+        steps_per_call = 1 if renderer is not None else iterations
+
+        end = self.t + iterations
+        while self.t < end:
+            steps = spread_engine.run_frontier(ros_at, burnable, self.state, min(steps_per_call, end - self.t),
+                                               self.max_ros, self.intensity, self.decay_rate, rng,
+                                               spread_engine.STENCILS[self.neighbors], weights_at, start_step=self.t,
+                                               ignition_step=self.ignition_step)
+            self._advance(steps, renderer)
+            if steps == 0 or not np.any(self.state == spread_engine.BURNING):
+                break
+
+    # Moves the clock after `steps` steps: intensity decays uniformly.
+    def _advance(self, steps, renderer):
+        self.t += steps
+        self.intensity = self._decayed(self.intensity, steps)
+        if renderer is not None:
+            renderer.show(self.state)
+
+    # Intensity `steps` steps after `intensity`, decayed one step at a time as
+    # the engines do, so a resumed run continues with the identical value.
+    def _decayed(self, intensity, steps):
+        for _ in range(steps):
+            intensity = max(0.0, intensity - self.decay_rate)
+        return intensity
+
+    # Runs `realizations` independent simulations at once from the start cell
+    # and returns a spread_engine.EnsembleResult (burn probability per cell,
+    # mean/variance and confidence interval of the unburned area).
+    # record=True also keeps every cell's ignition step (result.ignition_step)
+    # so the ensemble can be resumed after an edit (see resume_ensemble).
+    def ensemble(self, realizations=32, iterations=None, overlay_mask=None, rng=None, record=False):
+        iterations = self.iterations if iterations is None else iterations
+        burnable = self.burnable(overlay_mask)
+        _, ros_at, weights_at = self.spread_fields(burnable)
+        ignition_step = None
+        if record:
+            ignition_step = spread_engine.new_ignition_step((realizations, self.n, self.n), self.start)
+        return spread_engine.run_ensemble(ros_at, burnable, self.start, realizations, iterations, self.max_ros,
+                                          self.initial_intensity, self.decay_rate,
+                                          self.rng if rng is None else rng,
+                                          spread_engine.STENCILS[self.neighbors], weights_at,
+                                          ignition_step=ignition_step)
+
+    # Step from which a run recorded in reference_ignition (under
+    # reference_mask, None for no firebreak) must be recomputed for
+    # overlay_mask, at most `iterations`.
+    def _resume_step(self, reference_ignition, reference_mask, overlay_mask, iterations):
+        changed = np.zeros((self.n, self.n), dtype=bool)
+        for mask in (reference_mask, overlay_mask):
+            if mask is not None:
+                changed ^= mask
+        directions = spread_engine.STENCILS[self.neighbors]
+        return min(spread_engine.first_affected_step(reference_ignition, changed, directions), iterations)
+
+    # Incremental re-simulation after a local firebreak edit: given the
+    # ignition steps of a run under reference_mask (self.ignition_step after
+    # run(), or ensemble(record=True).ignition_step), simulates overlay_mask
+    # by restarting from the last step before the fire reaches any changed
+    # cell instead of from the ignition. Needs the reference's common random
+    # numbers, under which the result equals run(overlay_mask=...).
+    # resume_step is the number of steps reused.
+    def resume(self, reference_ignition, reference_mask, overlay_mask, iterations=None, engine=None, rng=None):
+        iterations = self.iterations if iterations is None else iterations
+        rng = self.rng if rng is None else rng
+        if not isinstance(rng, spread_engine.CommonRandomNumbers):
+            raise ValueError("Resuming a run needs common random numbers")
+        k = self._resume_step(reference_ignition, reference_mask, overlay_mask, iterations)
+        self.state = spread_engine.state_at(reference_ignition, k)
+        self.ignition_step = np.where(reference_ignition > k, spread_engine.NOT_IGNITED,
+                                      reference_ignition).astype(np.int16)
+        self.intensity = self._decayed(self.initial_intensity, k)
+        self.t = k
+        self.run(iterations - k, overlay_mask, engine, rng, reset=False)
+        self.resume_step = k
+        return self.state
+
+    # resume() for an ensemble recorded with ensemble(record=True), e.g. the
+    # baseline: returns the EnsembleResult of ensemble(record=True) under
+    # overlay_mask, with result.start_step the number of steps reused.
+    def resume_ensemble(self, reference, reference_mask, overlay_mask, iterations=None, rng=None):
+        iterations = self.iterations if iterations is None else iterations
+        rng = self.rng if rng is None else rng
+        if not isinstance(rng, spread_engine.CommonRandomNumbers):
+            raise ValueError("Resuming a run needs common random numbers")
+        k = self._resume_step(reference.ignition_step, reference_mask, overlay_mask, iterations)
+        ignition_step = np.where(reference.ignition_step > k, spread_engine.NOT_IGNITED,
+                                 reference.ignition_step).astype(np.int16)
+        burnable = self.burnable(overlay_mask)
+        _, ros_at, weights_at = self.spread_fields(burnable)
+        return spread_engine.run_ensemble(ros_at, burnable, self.start, reference.realizations, iterations - k,
+                                          self.max_ros, self._decayed(self.initial_intensity, k), self.decay_rate,
+                                          rng, spread_engine.STENCILS[self.neighbors], weights_at,
+                                          states=spread_engine.state_at(reference.ignition_step, k), start_step=k,
+                                          ignition_step=ignition_step)
+
+    # Spread parameters that determine results, for cache keys.
+    def parameters(self):
+        return {"start": list(self.start), "iterations": self.iterations,
+                "initial_intensity": self.initial_intensity, "decay_rate": self.decay_rate,
+                "max_ros": self.max_ros, "step_minutes": self.step_minutes, "neighbors": self.neighbors}
+
+    # No-firebreak reference: an ensemble of `realizations` runs without any
+    # overlay, under common random numbers with `seed` (the same noise the
+    # optimizer scores candidates with) or, with common_random_numbers=False,
+    # a Generator seeded with it. With a result_cache.ResultCache the result is
+    # stored per (environment hash, parameters, seed) and later calls load it
+    # instead of simulating. Ignition steps are recorded, so candidates can be
+    # resumed from the baseline (resume_ensemble with reference_mask=None).
+    def baseline(self, realizations=32, seed=0, common_random_numbers=True, cache=None):
+        key = None
+        if cache is not None:
+            params = dict(self.parameters(), realizations=realizations, seed=int(seed),
+                          common_random_numbers=common_random_numbers)
+            key = cache.key(self.env, params)
+            stored = cache.get(key)
+            if stored is not None:
+                return spread_engine.EnsembleResult(stored["states"], stored.get("ignition_step"))
+        rng = spread_engine.CommonRandomNumbers(seed) if common_random_numbers else np.random.default_rng(seed)
+        result = self.ensemble(realizations, rng=rng, record=True)
+        if cache is not None:
+            cache.put(key, {"states": result.states, "ignition_step": result.ignition_step})
+        return result
+
+    # Deterministic fire arrival time (minutes) of every cell from the start
+    # cell, by shortest travel time over the ROS field (see travel_time).
+    # Directional ROS follows wind and slope over a `neighbors` stencil, and
+    # the weather follows the forecast hour by hour unless hourly_weather is
+    # off. max_hours stops the search once the fire front passes that time.
+    def arrival_time(self, overlay_mask=None, neighbors=16, max_hours=None):
+        burnable = self.burnable(overlay_mask)
+        # One "step" per forecast hour.
+        hourly, ros_at, _ = self.spread_fields(burnable, 60 if self.step_minutes else 0)
+        directions = spread_engine.STENCILS[neighbors]
+
+        def factors_at(hour):
+            return hourly.derive(hour, "factors", lambda inputs: spread_engine.direction_factors(
+                directions, inputs["wind_speed"], inputs["wind_direction"], inputs["slope"], inputs["aspect"]))
+
+        max_minutes = np.inf if max_hours is None else 60 * max_hours
+        return travel_time.arrival_times(ros_at, burnable, self.start, rothermel_model.cell_spacing(self.env.coords),
+                                         directions, factors_at, max_minutes)
@@ -0,0 +1,402 @@
+from statistics import NormalDist
+
+import numpy as np
+
+# Cell fire states
+UNBURNED = 0
+BURNING = 1
+BURNED = 2
+
+# 4-neighborhood used by the cellular spread model (di, dj). Rows run south
+# to north and columns west to east, so di = 1 is north and dj = 1 is east.
+DIRECTIONS_4 = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+DIRECTIONS_8 = DIRECTIONS_4 + [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+DIRECTIONS_16 = DIRECTIONS_8 + [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
+STENCILS = {4: DIRECTIONS_4, 8: DIRECTIONS_8, 16: DIRECTIONS_16}
+
+# Directional spread coefficients of Alexandridis et al. (2008): wind speed in
+# m/s, slope angle in degrees. The overall effect of wind and slope on ROS is
+# already in the Rothermel model; these only set how spread is shared between
+# directions.
+WIND_DIRECTION_COEFF = 0.131
+SLOPE_DIRECTION_COEFF = 0.078
+
+
+# Destination/source slices that move a (..., n, m) field by (di, dj).
+def _shift_slices(di, dj, shape):
+    n_i, n_j = shape[-2:]
+    dst = (Ellipsis, slice(max(di, 0), n_i + min(di, 0)), slice(max(dj, 0), n_j + min(dj, 0)))
+    src = (Ellipsis, slice(max(-di, 0), n_i + min(-di, 0)), slice(max(-dj, 0), n_j + min(-dj, 0)))
+    return dst, src
+
+
+# Shifts a field so that out[i, j] = field[i - di, j - dj], i.e. every cell
+# sees the value of the neighbor that would spread into it along (di, dj).
+# Cells whose source neighbor falls outside the grid get `fill`.
+def shift(field, di, dj, fill=0):
+    out = np.full_like(field, fill)
+    dst, src = _shift_slices(di, dj, field.shape)
+    out[dst] = field[src]
+    return out
+
+
+# Cells a move by (di, dj) passes between its source and destination, as
+# offsets from the source: a diagonal move crosses both orthogonal cells at its
+# corner and a knight move the two cells beside its long leg. Unit moves cross
+# nothing.
+def crossed_cells(di, dj):
+    if abs(di) + abs(dj) == 1:
+        return []
+    if abs(di) == abs(dj) == 1:
+        return [(di, 0), (0, dj)]
+    if abs(dj) == 2:
+        return [(0, dj // 2), (di, dj // 2)]
+    return [(di // 2, 0), (di // 2, dj)]
+
+
+# Whether every cell can spread along each direction without crossing a
+# non-burnable cell, so that a one-cell firebreak also stops diagonal and
+# knight moves. One (n, n) mask per direction, indexed by the source cell, or
+# None for directions that cross no cell; cells outside the grid never block.
+def passability(burnable, directions=DIRECTIONS_4):
+    masks = []
+    for di, dj in directions:
+        mask = None
+        for ci, cj in crossed_cells(di, dj):
+            clear = shift(burnable, -ci, -cj, fill=True)
+            mask = clear if mask is None else mask & clear
+        masks.append(mask)
+    return masks
+
+
+# Probability that each cell is ignited by at least one burning neighbor,
+# given the per-cell spread probability of the burning cells (0 elsewhere).
+# Each neighbor gets an independent trial, so P = 1 - prod(1 - p_neighbor).
+# weights (optional, (dirs, n, n)) scales the probability of every source cell
+# toward each direction (see direction_weights); passable (optional, see
+# passability) drops the trials of moves that cross a non-burnable cell.
+def ignition_probability(source_prob, directions=DIRECTIONS_4, weights=None, passable=None):
+    keep = 1.0 - source_prob if weights is None else None
+    no_ignition = np.ones_like(source_prob)
+    for d, (di, dj) in enumerate(directions):
+        dst, src = _shift_slices(di, dj, source_prob.shape)
+        if weights is None:
+            trial = keep[src]
+        else:
+            trial = 1.0 - np.minimum(source_prob[src] * weights[d][src[-2:]], 1.0)
+        if passable is not None and passable[d] is not None:
+            trial = np.where(passable[d][src[-2:]], trial, 1.0)
+        no_ignition[dst] *= trial
+    return 1.0 - no_ignition
+
+# Relative rate of spread toward each neighbor, shape (dirs, n, n). Spread is
+# favored downwind (wind_direction is where the wind comes from, in degrees)
+# and upslope (aspect is the downslope direction). Normalized so the fastest
+# direction of every cell is 1: the Rothermel ROS is the head-fire rate.
+def direction_factors(directions, wind_speed, wind_direction, slope, aspect):
+    offsets = np.array(directions, dtype=np.float32)
+    bearing = np.degrees(np.arctan2(offsets[:, 1], offsets[:, 0]))[:, None, None]
+
+    downwind = np.radians(bearing - (wind_direction + 180))
+    wind_ms = wind_speed / 3.6  # Open-Meteo wind speed is in km/h
+    along_slope = np.degrees(np.arctan(slope / 100 * np.cos(np.radians(bearing - (aspect + 180)))))
+    exponent = WIND_DIRECTION_COEFF * wind_ms * (np.cos(downwind) - 1) + SLOPE_DIRECTION_COEFF * along_slope
+    return np.exp(exponent - exponent.max(axis=0)).astype(np.float32)
+
+# Per-direction spread weights, shape (dirs, n, n): the factor applied to a
+# burning cell's spread probability toward each neighbor. direction_factors,
+# reduced for farther neighbors and normalized to sum to 4 in every cell, so
+# with no wind and no slope an 8- or 16-neighbor stencil spreads about as much
+# as the 4-neighbor one.
+def direction_weights(directions, wind_speed, wind_direction, slope, aspect):
+    offsets = np.array(directions, dtype=np.float32)
+    distance = np.hypot(offsets[:, 0], offsets[:, 1])[:, None, None]
+    weights = direction_factors(directions, wind_speed, wind_direction, slope, aspect) / distance
+    return (4 * weights / weights.sum(axis=0)).astype(np.float32)
+
+
+# Advances fire_state by one step in place.
+#   spread_prob: per-cell probability that a burning cell spreads to a neighbor
+#   burnable:    boolean mask of cells that can ignite
+#   draws:       uniform [0, 1) draws, one per cell
+#   directions / weights: neighbor stencil and optional per-direction weights
+#   passable:    passability(burnable, directions), computed if not given
+# Returns the mask of newly ignited cells.
+def step(fire_state, spread_prob, burnable, draws, directions=DIRECTIONS_4, weights=None, passable=None):
+    if passable is None:
+        passable = passability(burnable, directions)
+    burning = fire_state == BURNING
+    source_prob = np.where(burning, spread_prob, np.float32(0.0))
+    ignition_prob = ignition_probability(source_prob, directions, weights, passable)
+    ignite = (fire_state == UNBURNED) & burnable & (draws < ignition_prob)
+    fire_state[burning] = BURNED
+    fire_state[ignite] = BURNING
+    return ignite
+
+
+# SplitMix64 constants: the golden-ratio counter increment and the output mix.
+_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+# Cells per block when generating a whole draw field.
+_DRAW_BLOCK = 1 << 16
+
+
+# Uniform [0, 1) float32 draws for the uint64 `counters` under `key`: the
+# SplitMix64 output for state key + counter * gamma, so every counter's draw is
+# computed on its own. Modifies counters in place.
+def _counter_uniforms(key, counters):
+    counters *= _GAMMA
+    counters += key
+    counters ^= counters >> np.uint64(30)
+    counters *= _MIX_1
+    counters ^= counters >> np.uint64(27)
+    counters *= _MIX_2
+    counters ^= counters >> np.uint64(31)
+    return (counters >> np.uint64(40)).astype(np.float32) * np.float32(2.0 ** -24)
+
+
+class CommonRandomNumbers:
+    """
+    Common-random-numbers source: the uniform draws for step t depend only on
+    (seed, t), so every candidate simulated with the same instance sees exactly
+    the same per-cell, per-step noise. Differences between candidates then come
+    from the candidates, not from the sampling.
+    Draws are regenerated on demand rather than stored. They are counter-based
+    (a key per (seed, t), a counter per flat cell index), so the draws of a
+    few cells cost no more than those cells: cell_draws(t, cells) equals
+    draws(t, shape).ravel()[cells].
+    """
+
+    def __init__(self, seed):
+        self.seed = seed
+
+    def _key(self, t):
+        return np.random.SeedSequence([self.seed, t]).generate_state(1, np.uint64)[0]
+
+    def draws(self, t, shape):
+        key = self._key(t)
+        out = np.empty(int(np.prod(shape)), dtype=np.float32)
+        for start in range(0, out.size, _DRAW_BLOCK):
+            block = np.arange(start, min(start + _DRAW_BLOCK, out.size), dtype=np.uint64)
+            out[start:start + block.size] = _counter_uniforms(key, block)
+        return out.reshape(shape)
+
+    # Draws of the cells at flat indices `cells` of the step-t field.
+    def cell_draws(self, t, cells):
+        return _counter_uniforms(self._key(t), np.array(cells, dtype=np.uint64))
+
+
+# Uniform [0, 1) draws for step t from either a numpy Generator or a
+# CommonRandomNumbers source.
+def uniform_draws(rng, t, shape):
+    if isinstance(rng, CommonRandomNumbers):
+        return rng.draws(t, shape)
+    return rng.random(shape, dtype=np.float32)
+
+
+# Probability that a burning cell spreads to each neighbor, scaled from ROS.
+def spread_probability(ros, intensity, max_ros):
+    return np.minimum((ros * intensity) / max_ros, 1.0).astype(np.float32)
+
+
+class EnsembleResult:
+    """
+    Final states of K independent realizations, shape (K, n, n), with the
+    summary statistics the optimizer needs.
+    """
+
+    def __init__(self, states, ignition_step=None, start_step=0):
+        self.states = states
+        self.ignition_step = ignition_step
+        self.start_step = start_step
+        self.realizations = states.shape[0]
+        self.unburned = np.count_nonzero(states == UNBURNED, axis=(1, 2))
+
+    # This result and `other` (more realizations of the same run) as one
+    # ensemble; ignition steps are kept only if both recorded them.
+    def pooled(self, other):
+        ignition_step = None
+        if self.ignition_step is not None and other.ignition_step is not None:
+            ignition_step = np.concatenate([self.ignition_step, other.ignition_step])
+        return EnsembleResult(np.concatenate([self.states, other.states]), ignition_step)
+
+    # Per-cell probability of burning (burning or burned at the end).
+    @property
+    def burn_probability(self):
+        return np.mean(self.states != UNBURNED, axis=0)
+
+    @property
+    def mean_unburned(self):
+        return float(np.mean(self.unburned))
+
+    @property
+    def var_unburned(self):
+        return float(np.var(self.unburned, ddof=1)) if self.realizations > 1 else 0.0
+
+    # Normal-approximation confidence interval for the mean unburned area.
+    def confidence_interval(self, level=0.95):
+        z = NormalDist().inv_cdf(0.5 + level / 2)
+        half_width = z * np.sqrt(self.var_unburned / self.realizations)
+        return self.mean_unburned - half_width, self.mean_unburned + half_width
+
+
+# Runs K realizations at once as a stacked (K, n, n) state array.
+#   ros:      (n, n) rate of spread per cell (0 where it cannot spread), or a
+#             function ros(t) returning that field for step t (hourly weather)
+#   burnable: (n, n) mask of cells that can ignite
+#   ignition: (i, j) starting cell
+#   rng:      numpy Generator or CommonRandomNumbers (fresh Generator if None)
+#   directions / weights: neighbor stencil and optional (dirs, n, n) weights,
+#             which may also be a function of the step like ros
+# Intensity starts at initial_intensity and decays by decay_rate each step,
+# as in fire_spread_sim. Stops early once no realization has burning cells.
+# To resume a run, pass its (K, n, n) states at step start_step (ignition is
+# then unused) and the intensity at that step. ignition_step (optional,
+# (K, n, n)) is updated in place with the step at which cells ignite.
+def run_ensemble(ros, burnable, ignition, realizations, iterations, max_ros,
+                 initial_intensity=1.0, decay_rate=0.02, rng=None, directions=DIRECTIONS_4, weights=None,
+                 states=None, start_step=0, ignition_step=None):
+    if rng is None:
+        rng = np.random.default_rng()
+    n = burnable.shape[0]
+    if states is None:
+        states = np.zeros((realizations, n, n), dtype=np.int8)
+        states[:, ignition[0], ignition[1]] = BURNING
+    intensity = initial_intensity
+    passable = passability(burnable, directions)
+
+    for t in range(start_step, start_step + iterations):
+        if not np.any(states == BURNING):
+            break
+        spread_prob = spread_probability(ros(t) if callable(ros) else ros, intensity, max_ros)
+        ignite = step(states, spread_prob, burnable, uniform_draws(rng, t, (realizations, n, n)), directions,
+                      weights(t) if callable(weights) else weights, passable)
+        if ignition_step is not None:
+            ignition_step[ignite] = t + 1
+        intensity = max(0.0, intensity - decay_rate)
+    return EnsembleResult(states, ignition_step, start_step)
+
+
+# Ignition-step records, for resuming a run after a local edit. An
+# ignition_step array (shape (..., n, n), int16) holds for every cell the
+# number of steps after which it is burning (0 for the start cell) or
+# NOT_IGNITED. A cell burns for exactly one step, so the record determines the
+# state after every step.
+NOT_IGNITED = -1
+
+
+def new_ignition_step(shape, ignition):
+    ignition_step = np.full(shape, NOT_IGNITED, dtype=np.int16)
+    ignition_step[..., ignition[0], ignition[1]] = 0
+    return ignition_step
+
+
+# Fire state after k steps of the run recorded in ignition_step.
+def state_at(ignition_step, k):
+    state = np.full(ignition_step.shape, UNBURNED, dtype=np.int8)
+    state[(ignition_step >= 0) & (ignition_step < k)] = BURNED
+    state[ignition_step == k] = BURNING
+    return state
+
+
+# First step at which editing the cells in `changed` (an (n, n) mask, e.g.
+# cells that became or stopped being firebreaks) can alter the recorded run:
+# the earliest step at which a changed cell, or a neighbor that could spread
+# into or across it, is burning (the cells a move crosses are all within its
+# stencil). Under common random numbers the edited run is identical
+# up to the state at that step. Returns a value past any iteration count
+# if the fire never comes near a changed cell.
+def first_affected_step(ignition_step, changed, directions=DIRECTIONS_4):
+    never = np.iinfo(np.int32).max
+    reached = np.where(ignition_step >= 0, ignition_step.astype(np.int32), never)
+    earliest = reached.copy()
+    for di, dj in directions:
+        np.minimum(earliest, shift(reached, di, dj, fill=never), out=earliest)
+    touched = earliest[..., changed]
+    return int(touched.min()) if touched.size else never
+
+
+# Fraction of the grid burning above which run_frontier switches to full-grid steps.
+DENSE_FRACTION = 0.02
+
+
+# One step restricted to the burning cells `frontier` (flat indices) and their
+# neighbors. Same rules and float32 arithmetic as step(), so with common random
+# numbers both produce identical states. Returns the new frontier.
+def _sparse_step(state, frontier, ros, intensity, max_ros, burnable, draw, directions, weights, passable):
+    n = state.shape[0]
+    flat_state, flat_burnable = state.ravel(), burnable.ravel()
+    i, j = np.divmod(frontier, n)
+    source_prob = spread_probability(ros[i, j], intensity, max_ros)
+
+    targets, keeps = [], []
+    for d, (di, dj) in enumerate(directions):
+        ni, nj = i + di, j + dj
+        inside = (ni >= 0) & (ni < n) & (nj >= 0) & (nj < n)
+        if passable[d] is not None:
+            inside &= passable[d][i, j]
+        if weights is None:
+            keep = 1.0 - source_prob[inside]
+        else:
+            keep = 1.0 - np.minimum(source_prob[inside] * weights[d][i[inside], j[inside]], 1.0)
+        targets.append(ni[inside] * n + nj[inside])
+        keeps.append(keep)
+
+    candidates = np.concatenate(targets)
+    candidates = np.unique(candidates[(flat_state[candidates] == UNBURNED) & flat_burnable[candidates]])
+    no_ignition = np.ones(len(candidates), dtype=source_prob.dtype)
+    for target, keep in zip(targets, keeps):
+        # A cell has at most one source per direction, so positions are unique.
+        pos = np.minimum(np.searchsorted(candidates, target), max(len(candidates) - 1, 0))
+        hit = (candidates[pos] == target) if len(candidates) else np.zeros(len(target), dtype=bool)
+        no_ignition[pos[hit]] *= keep[hit]
+
+    ignited = candidates[draw(candidates) < 1.0 - no_ignition]
+    flat_state[frontier] = BURNED
+    flat_state[ignited] = BURNING
+    return ignited
+
+
+# Single-realization engine that only touches the burning frontier while it is
+# small. state is an (n, n) int8 array (UNBURNED/BURNING/BURNED), advanced in
+# place from step start_step. ros and weights may be functions of the step, as
+# in run_ensemble; intensity starts at `intensity` and decays by decay_rate.
+# Each step runs sparse while at most dense_fraction of the grid is burning and
+# as a full-grid step() otherwise, and the run stops as soon as nothing burns.
+# ignition_step (optional) is updated in place as in run_ensemble.
+# Returns the number of steps run.
+def run_frontier(ros, burnable, state, iterations, max_ros, intensity=1.0, decay_rate=0.02, rng=None,
+                 directions=DIRECTIONS_4, weights=None, start_step=0, dense_fraction=DENSE_FRACTION,
+                 ignition_step=None):
+    if rng is None:
+        rng = np.random.default_rng()
+    n = state.shape[0]
+    frontier = np.flatnonzero(state == BURNING)
+    passable = passability(burnable, directions)
+
+    steps = 0
+    for t in range(start_step, start_step + iterations):
+        if len(frontier) == 0:
+            break
+        step_ros = ros(t) if callable(ros) else ros
+        step_weights = weights(t) if callable(weights) else weights
+        if len(frontier) > dense_fraction * n * n:
+            spread_prob = spread_probability(step_ros, intensity, max_ros)
+            ignite = step(state, spread_prob, burnable, uniform_draws(rng, t, (n, n)), directions, step_weights,
+                          passable)
+            frontier = np.flatnonzero(state == BURNING)
+            if ignition_step is not None:
+                ignition_step[ignite] = t + 1
+        else:
+            if isinstance(rng, CommonRandomNumbers):
+                draw = lambda cells: rng.cell_draws(t, cells)
+            else:
+                draw = lambda cells: rng.random(len(cells), dtype=np.float32)
+            frontier = _sparse_step(state, frontier, step_ros, intensity, max_ros, burnable, draw, directions,
+                                    step_weights, passable)
+            if ignition_step is not None:
+                ignition_step.flat[frontier] = t + 1
+        intensity = max(0.0, intensity - decay_rate)
+        steps += 1
+    return steps
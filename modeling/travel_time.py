@@ -0,0 +1,101 @@
+import heapq
+
+import numpy as np
+
+from spread_engine import DIRECTIONS_16, passability
+
+# Deterministic spread mode: the time fire takes to reach every cell, from one
+# shortest-path (Dijkstra) pass over the rate-of-spread field. Fire moves from a
+# cell to its neighbor in direction d in distance_d / (ros * factor_d) minutes,
+# using the ROS (m/min) and directional factor of the cell it leaves, as in the
+# cellular model. Cells that cannot burn are never entered, and diagonal and
+# knight moves never pass between them, so a firebreak one cell wide stops the
+# fire.
+#
+# A larger stencil gives more travel directions: the 4-neighbor stencil
+# overestimates diagonal arrival times by up to 41%, 8 neighbors by up to 8%,
+# 16 neighbors by up to 3%.
+
+
+# Minutes to travel from each cell to its neighbor in every direction, shape
+# (n * n, dirs); inf where the cell does not spread.
+#   ros:     (n, n) rate of spread in m/min
+#   spacing: (north-south, east-west) cell spacing in meters
+#   factors: optional (dirs, n, n) relative ROS per direction (spread_engine.direction_factors)
+#   burnable: optional mask; moves crossing a non-burnable cell take inf
+def edge_times(ros, spacing, directions=DIRECTIONS_16, factors=None, burnable=None):
+    dy, dx = spacing
+    n = ros.shape[0]
+    times = np.empty((n * n, len(directions)))
+    passable = [None] * len(directions) if burnable is None else passability(burnable, directions)
+    with np.errstate(divide="ignore"):
+        for d, (di, dj) in enumerate(directions):
+            rate = ros if factors is None else ros * factors[d]
+            minutes = np.hypot(di * dy, dj * dx) / rate
+            if passable[d] is not None:
+                minutes = np.where(passable[d], minutes, np.inf)
+            times[:, d] = minutes.ravel()
+    return times
+
+
+# Arrival time in minutes of every cell, inf where the fire never arrives.
+#   ros, factors: arrays, or functions of the hour since ignition returning
+#                 them (e.g. an hourly forecast); each cell spreads with the
+#                 fields of the hour in which it ignites
+#   burnable:     boolean mask of cells the fire can enter
+#   ignition:     (i, j) cell, list of cells, or boolean mask, all at time 0
+#   max_minutes:  stop once the fire front passes this time
+def arrival_times(ros, burnable, ignition, spacing, directions=DIRECTIONS_16, factors=None, max_minutes=np.inf):
+    n = burnable.shape[0]
+    flat_burnable = burnable.ravel().tolist()
+    hourly_times = {}
+
+    def times_at(minutes):
+        hour = int(minutes // 60) if callable(ros) or callable(factors) else 0
+        if hour not in hourly_times:
+            hour_ros = ros(hour) if callable(ros) else ros
+            hour_factors = factors(hour) if callable(factors) else factors
+            hourly_times[hour] = edge_times(hour_ros, spacing, directions, hour_factors, burnable)
+        return hourly_times[hour]
+
+    if isinstance(ignition, np.ndarray) and ignition.dtype == bool:
+        sources = np.flatnonzero(ignition).tolist()
+    else:
+        sources = [i * n + j for i, j in np.atleast_2d(ignition).tolist()]
+    arrival = [np.inf] * (n * n)
+    heap = []
+    for cell in sources:
+        arrival[cell] = 0.0
+        heap.append((0.0, cell))
+    heapq.heapify(heap)
+
+    while heap:
+        t, cell = heapq.heappop(heap)
+        if t > arrival[cell]:
+            continue  # already reached sooner
+        i, j = divmod(cell, n)
+        times = times_at(t)[cell].tolist()
+        for (di, dj), dt in zip(directions, times):
+            ni, nj = i + di, j + dj
+            if 0 <= ni < n and 0 <= nj < n:
+                neighbor = ni * n + nj
+                t_neighbor = t + dt
+                if t_neighbor < arrival[neighbor] and t_neighbor <= max_minutes and flat_burnable[neighbor]:
+                    arrival[neighbor] = t_neighbor
+                    heapq.heappush(heap, (t_neighbor, neighbor))
+    return np.array(arrival).reshape(n, n)
+
+
+# Isochrone index of every cell: k where the fire arrives in
+# [k * interval, (k + 1) * interval), -1 where it never arrives.
+def isochrones(arrival, interval):
+    index = np.full(arrival.shape, -1, dtype=np.int32)
+    reached = np.isfinite(arrival)
+    index[reached] = (arrival[reached] // interval).astype(np.int32)
+    return index
+
+
+# Cells reached less than `minutes` after ignition (the union of the
+# isochrones below minutes / interval).
+def burned_within(arrival, minutes):
+    return arrival < minutes
@@ -0,0 +1,57 @@
+import os
+import pickle
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "modeling"))
+import env_store
+from environment import as_environment
+
+ENV_1 = os.path.join(os.path.dirname(__file__), "..", "cached_grid_states", "environments", "env_1.pkl")
+
+
+def test_pickle_conversion_round_trips(tmp_path):
+    with open(ENV_1, "rb") as f:
+        legacy = as_environment(pickle.load(f))
+    env = env_store.convert_pickle(ENV_1, str(tmp_path / "env_1"))
+
+    for name in env_store.ARRAY_FILES:
+        assert np.array_equal(getattr(env, name), getattr(legacy, name))
+    assert env.fields.keys() == legacy.fields.keys()
+    for name in legacy.fields:
+        assert np.array_equal(env.fields[name], legacy.fields[name], equal_nan=True)
+    assert env.date == legacy.date
+    assert dict(env[3][4]) == dict(legacy[3][4])
+
+    header = env_store.read_header(str(tmp_path / "env_1"))
+    assert header["grid_size"] == 30 and header["radius"] == 10.0
+
+    # Edits to a memory-mapped environment stay in memory.
+    env.fuel[:] = 0
+    assert np.array_equal(env_store.load_environment(str(tmp_path / "env_1")).fuel, legacy.fuel)
+
+
+def test_load_or_convert_migrates_legacy_pickle(tmp_path):
+    path = str(tmp_path / "saved_grid")
+    assert env_store.load_or_convert(path) is None
+    with open(ENV_1, "rb") as src, open(path + ".pkl", "wb") as dst:
+        dst.write(src.read())
+    assert env_store.load_or_convert(path).n == 30
+    os.remove(path + ".pkl")
+    assert env_store.load_or_convert(path).n == 30
+
+
+def test_forecast_round_trips(tmp_path):
+    env = env_store.load_environment(ENV_1.replace(".pkl", ""), mmap=False)
+    assert env.forecast is None
+    env.forecast = np.random.default_rng(0).random((5, 30, 30, 2), dtype=np.float32)
+    env.forecast_times = 1700000000 + 3600 * np.arange(5)
+    env.forecast_fields = ["Temperature (2 m)", "Wind Speed (80 m)"]
+    env_store.save_environment(env, str(tmp_path / "env"))
+
+    loaded = env_store.load_environment(str(tmp_path / "env"))
+    assert np.array_equal(loaded.forecast, env.forecast)
+    assert np.array_equal(loaded.forecast_times, env.forecast_times)
+    assert loaded.forecast_fields == env.forecast_fields
+    assert np.array_equal(loaded.forecast_field(2, "Wind Speed (80 m)", 5.0), env.forecast[2, ..., 1])
@@ -0,0 +1,98 @@
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "modeling"))
+import fuel_models
+from data_retrieval import google_earth_segmentation
+from data_retrieval.google_earth_segmentation import GLOBCOVER_PIXEL_SIZE, LocalLandcoverRaster
+from environment import UNKNOWN_COLOR
+from data_retrieval.landcover_tiles import LandcoverTileCache
+
+
+# Raster aligned with the GlobCover pixel grid, so cached and direct lookups agree.
+def make_raster():
+    rng = np.random.default_rng(0)
+    values = rng.choice([14, 70, 130, 140, 210], size=(90, 120)).astype(np.uint8)
+    return LocalLandcoverRaster(values, north=38.0, west=-120.0, pixel_size=GLOBCOVER_PIXEL_SIZE)
+
+
+def test_landcover_values_map_to_fuel_codes_and_colors():
+    # Rainfed cropland, needleleaved forest, shrubland, water, unclassified, and a value GlobCover never uses.
+    values = np.array([[14, 70, 130], [210, 230, 0]])
+    fuel, rgb = google_earth_segmentation.landcover_to_fuel(values)
+    assert [fuel_models.name_of(code) for code in fuel.ravel()] == ["GR2", "TU1", "SH5", "NB8", "NB9", "NB9"]
+    assert rgb.shape == (2, 3, 3) and rgb.dtype == np.uint8
+    assert [tuple(c) for c in rgb.reshape(-1, 3)] == [(0xff, 0xff, 0x63), (0x00, 0x3b, 0x00), (0x95, 0x63, 0x00),
+                                                        (0x00, 0x46, 0xc7), (0x74, 0x34, 0x11), UNKNOWN_COLOR]
+    for value, fuel_type in google_earth_segmentation.globcover_to_fuel_type.items():
+        assert google_earth_segmentation.FUEL_CODE_LUT[value] == fuel_models.code_of(fuel_type)
+
+
+def test_landcover_grid_samples_every_cell_in_one_call():
+    raster = make_raster()
+    calls = []
+
+    class CountingSource:
+        def sample(self, lats, lons):
+            calls.append(np.size(lats))
+            return raster.sample(lats, lons)
+
+    # Cell centers at pixel centers, plus one row north of the raster (unclassified).
+    rows, cols = np.meshgrid(np.arange(-1, 30), np.arange(40), indexing="ij")
+    lats = 38.0 - (rows + 0.5) * GLOBCOVER_PIXEL_SIZE
+    lons = -120.0 + (cols + 0.5) * GLOBCOVER_PIXEL_SIZE
+    grid = google_earth_segmentation.get_landcover_grid(lats, lons, CountingSource())
+    assert calls == [lats.size] and grid.shape == lats.shape
+    assert np.all(grid[0] == google_earth_segmentation.UNCLASSIFIED)
+    assert np.array_equal(grid[1:], raster.values[:30, :40])
+
+
+def test_tiles_are_fetched_once_and_reused_from_disk(tmp_path):
+    raster = make_raster()
+    lats, lons = np.meshgrid(np.linspace(37.76, 37.99, 40), np.linspace(-119.99, -119.68, 40), indexing="ij")
+
+    cache = LandcoverTileCache(raster, cache_dir=str(tmp_path), tile_pixels=32)
+    first = cache.sample(lats, lons)
+    assert np.array_equal(first, raster.sample(lats, lons))
+    assert cache.tiles_fetched == len(os.listdir(tmp_path)) > 1
+
+    # A later, finer build over the same area reads every tile from disk.
+    class NoSource:
+        def fetch_tile(self, *args):
+            raise AssertionError("tile should come from the cache")
+
+    offline = LandcoverTileCache(NoSource(), cache_dir=str(tmp_path), tile_pixels=32)
+    assert np.array_equal(offline.sample(lats, lons), first)
+    fine_lats, fine_lons = np.meshgrid(np.linspace(37.8, 37.9, 80), np.linspace(-119.9, -119.7, 80), indexing="ij")
+    assert np.array_equal(offline.sample(fine_lats, fine_lons), raster.sample(fine_lats, fine_lons))
+    assert offline.tiles_fetched == 0
+
+
+def test_tiles_load_in_parallel_and_each_is_fetched_once(tmp_path):
+    raster = make_raster()
+    fetches = []
+    # Every fetch waits until all four tiles are being fetched at once, so
+    # fetches serialized behind the cache lock break the barrier.
+    all_fetching = threading.Barrier(4, timeout=5)
+
+    class BlockingSource:
+        def fetch_tile(self, *args):
+            fetches.append(args[:2])
+            all_fetching.wait()
+            return raster.fetch_tile(*args)
+
+    cache = LandcoverTileCache(BlockingSource(), cache_dir=str(tmp_path), tile_pixels=32)
+    # Four threads per tile, over four tiles.
+    corners = [(37.99, -119.99), (37.99, -119.6), (37.8, -119.99), (37.8, -119.6)]
+    with ThreadPoolExecutor(16) as pool:
+        results = list(pool.map(lambda point: cache.sample([point[0]], [point[1]]), corners * 4))
+
+    assert len(fetches) == len(set(fetches)) == cache.tiles_fetched == 4
+    assert not all_fetching.broken
+    for k, point in enumerate(corners * 4):
+        assert np.array_equal(results[k], raster.sample([point[0]], [point[1]]))
+    assert not cache.loading
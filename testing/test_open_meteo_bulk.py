@@ -0,0 +1,254 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pytest
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "modeling"))
+import build_env
+from data_retrieval import open_meteo_client
+from data_retrieval.google_earth_segmentation import GLOBCOVER_PIXEL_SIZE, LocalLandcoverRaster
+from data_retrieval.rate_limit import TokenBucket, call_with_retry
+from data_retrieval.weather_cache import WeatherCache
+
+
+# Local stand-in for the Open-Meteo forecast and elevation endpoints: every
+# variable's value is latitude + longitude + hour index, and elevation is
+# 1000 + latitude, so results can be checked exactly.
+class StubForecastHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        lats = [float(v) for v in query["latitude"][0].split(",")]
+        lons = [float(v) for v in query["longitude"][0].split(",")]
+        if url.path.endswith("/elevation"):
+            self.send_json({"elevation": [1000 + lat for lat in lats]})
+            return
+        variables = query["hourly"][0].split(",")
+        StubForecastHandler.requests_seen.append(len(lats))
+
+        now_hour = int(time.time()) // 3600 * 3600
+        times = [now_hour + 3600 * (k - 24) for k in range(48)]
+        body = []
+        for lat, lon in zip(lats, lons):
+            hourly = {"time": times}
+            for var in variables:
+                hourly[var] = [lat + lon + k for k in range(48)]
+            body.append({"latitude": lat, "longitude": lon, "elevation": 1000 + lat, "hourly": hourly})
+        self.send_json(body if len(body) > 1 else body[0])
+
+    def send_json(self, body):
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_bulk_fetch_chunks_and_selects_closest_hour():
+    server = HTTPServer(("127.0.0.1", 0), StubForecastHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/v1/forecast"
+    StubForecastHandler.requests_seen.clear()
+
+    locations = [(37.0 + 0.01 * k, -119.0 - 0.01 * k) for k in range(25)]
+    try:
+        data = open_meteo_client.get_attributes_by_locations(locations, chunk_size=10, url=url,
+                                                             session=requests.Session())
+    finally:
+        server.shutdown()
+
+    assert StubForecastHandler.requests_seen == [10, 10, 5]
+    lats = np.array([loc[0] for loc in locations])
+    lons = np.array([loc[1] for loc in locations])
+    # Hour index 24 is the current hour (or 25 late in the hour).
+    offset = data["Temperature (2 m)"] - (lats + lons)
+    assert np.allclose(offset, offset[0], atol=1e-3) and round(float(offset[0])) in (24, 25)
+    assert np.allclose(data["elevation"], 1000 + lats)
+    assert data["Wind Direction (80 m)"].shape == (25,)
+    assert len(data["Date"]) == 25
+
+
+def test_cached_fetch_collapses_cells_into_weather_pixels(tmp_path):
+    server = HTTPServer(("127.0.0.1", 0), StubForecastHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}/v1"
+    StubForecastHandler.requests_seen.clear()
+
+    # 20 x 20 cells about 0.005 deg apart span 4 x 4 weather pixels of 0.025 deg.
+    lats, lons = np.meshgrid(37.0 + 0.005 * np.arange(20), -119.0 + 0.005 * np.arange(20), indexing="ij")
+    locations = np.stack([lats.ravel(), lons.ravel()], axis=1)
+    cache = WeatherCache(str(tmp_path / "weather.sqlite"), pixel_deg=0.025)
+    try:
+        first = open_meteo_client.get_cached_attributes_by_locations(locations, cache, url=base + "/forecast",
+                                                                     elevation_url=base + "/elevation",
+                                                                     session=requests.Session())
+        fetched_pixels = sum(StubForecastHandler.requests_seen)
+        # A second process sharing the file gets every pixel from the cache.
+        second_cache = WeatherCache(str(tmp_path / "weather.sqlite"), pixel_deg=0.025)
+        second = open_meteo_client.get_cached_attributes_by_locations(locations, second_cache,
+                                                                      url=base + "/forecast",
+                                                                      elevation_url=base + "/elevation",
+                                                                      session=requests.Session())
+    finally:
+        server.shutdown()
+
+    assert fetched_pixels == len(cache) <= 25
+    assert (cache.hits, cache.misses) == (0, fetched_pixels)
+    assert (second_cache.hits, second_cache.misses) == (fetched_pixels, 0)
+    assert sum(StubForecastHandler.requests_seen) == fetched_pixels
+    assert np.array_equal(first["Temperature (2 m)"], second["Temperature (2 m)"])
+    assert np.array_equal(first["elevation"], second["elevation"])
+
+    # Cells take the weather of their pixel center and keep their own elevation.
+    pixel_lats = np.round(locations[:, 0] / 0.025) * 0.025
+    pixel_lons = np.round(locations[:, 1] / 0.025) * 0.025
+    offset = first["Temperature (2 m)"] - (pixel_lats + pixel_lons)
+    assert np.allclose(offset, offset[0], atol=1e-3)
+    assert np.allclose(first["elevation"], 1000 + locations[:, 0])
+
+    # The hourly series from the current hour on is kept: the stub serves 24 more hours.
+    hours = len(first["forecast_times"])
+    assert first["forecast"].shape == (hours, 400, 13) and hours in (23, 24)
+    assert np.array_equal(first["forecast"][0, :, 0], first["Temperature (2 m)"])
+    assert np.allclose(first["forecast"][1:, :, 0] - first["forecast"][:-1, :, 0], 1.0)
+    assert np.all(np.diff(first["forecast_times"]) == 3600)
+
+
+def test_weather_cache_ttl_and_lru(tmp_path):
+    cache = WeatherCache(str(tmp_path / "weather.sqlite"), max_entries=3)
+    for k in range(3):
+        cache.put_many({(k, 0): np.full(13, k)}, hour=0)
+        time.sleep(0.01)
+    cache.get_many([(0, 0)], hour=0)
+    time.sleep(0.01)
+    cache.put_many({(3, 0): np.full(13, 3)}, hour=0)
+    assert sorted(cache.get_many([(k, 0) for k in range(4)], hour=0)) == [(0, 0), (2, 0), (3, 0)]
+
+    expired = WeatherCache(str(tmp_path / "weather.sqlite"), ttl=0)
+    time.sleep(0.01)
+    assert expired.get_many([(0, 0)], hour=0) == {}
+    assert expired.hit_rate == 0.0
+
+
+# StubForecastHandler with network latency, failing the first `failures`
+# requests with 503 to exercise retries. While `overlap` holds a barrier,
+# requests wait on it, so `overlapped` is only set once two requests are in
+# flight at the same time.
+class SlowForecastHandler(StubForecastHandler):
+    delay = 0.05
+    failures = 0
+    attempts = 0
+    overlap = None
+    overlapped = False
+    lock = threading.Lock()
+
+    def do_GET(self):
+        barrier = SlowForecastHandler.overlap
+        if barrier is not None:
+            try:
+                barrier.wait()
+                SlowForecastHandler.overlap = None
+                SlowForecastHandler.overlapped = True
+            except threading.BrokenBarrierError:
+                pass
+        time.sleep(self.delay)
+        with SlowForecastHandler.lock:
+            SlowForecastHandler.attempts += 1
+            fail = SlowForecastHandler.attempts <= SlowForecastHandler.failures
+        if fail:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        super().do_GET()
+
+
+def test_concurrent_build_matches_sequential_build(tmp_path, monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowForecastHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}/v1"
+    center = (37.5, -119.0)
+    rng = np.random.default_rng(0)
+    landcover = LocalLandcoverRaster(rng.choice([14, 70, 130, 140, 210], size=(200, 200)).astype(np.uint8),
+                                     north=37.8, west=-119.3, pixel_size=GLOBCOVER_PIXEL_SIZE)
+    urls = {"weather_url": base + "/forecast", "elevation_url": base + "/elevation"}
+    monkeypatch.setattr(build_env, "RETRY_DELAY", 0.01)
+    # Rate limits out of the way, so requests can overlap.
+    monkeypatch.setattr(build_env, "WEATHER_RATE", 100)
+    monkeypatch.setattr(build_env, "LANDCOVER_RATE", 100)
+
+    try:
+        sequential = build_env.build_grid(center, 10, 40, landcover, weather_session=requests.Session(),
+                                          weather_cache=WeatherCache(str(tmp_path / "a.sqlite")), **urls)
+
+        # The first two requests of the concurrent build are in flight together.
+        SlowForecastHandler.overlap = threading.Barrier(2, timeout=10)
+        concurrent = build_env.build_grid_concurrent(center, 10, 40, landcover, chunk_size=200, progress=None,
+                                                     weather_cache=WeatherCache(str(tmp_path / "b.sqlite")), **urls)
+        assert SlowForecastHandler.overlapped
+
+        # Two failed requests are retried, one attempt each.
+        SlowForecastHandler.attempts = 0
+        SlowForecastHandler.failures = 2
+        retried = build_env.build_grid_concurrent(center, 10, 40, landcover, chunk_size=200, progress=None,
+                                                  weather_cache=WeatherCache(str(tmp_path / "c.sqlite")), **urls)
+    finally:
+        SlowForecastHandler.failures = 0
+        SlowForecastHandler.overlap = None
+        server.shutdown()
+
+    assert np.array_equal(concurrent.coords, sequential.coords)
+    assert sorted(concurrent.fields) == sorted(sequential.fields)
+    for name in sequential.fields:
+        assert np.array_equal(concurrent.fields[name], sequential.fields[name], equal_nan=True), name
+    assert np.array_equal(concurrent.forecast, sequential.forecast, equal_nan=True)
+    assert np.array_equal(concurrent.forecast_times, sequential.forecast_times)
+    assert np.array_equal(concurrent.fuel, sequential.fuel) and np.array_equal(concurrent.fuel_rgb, sequential.fuel_rgb)
+    assert np.array_equal(retried.forecast, sequential.forecast, equal_nan=True)
+
+    # 8 chunks, each a forecast and an elevation request, plus one request
+    # per injected failure: the session does not retry on its own.
+    assert SlowForecastHandler.attempts == 2 * 8 + 2
+
+
+def test_token_bucket_limits_the_request_rate():
+    bucket = TokenBucket(rate=20, capacity=1)
+    started = time.perf_counter()
+    for _ in range(6):
+        bucket.acquire()
+    assert time.perf_counter() - started >= 5 / 20 - 0.01
+
+    # Retries back off exponentially and take a token per attempt.
+    attempts = []
+    taken = []
+    bucket.acquire = lambda tokens=1: taken.append(tokens)
+
+    def flaky():
+        attempts.append(time.perf_counter())
+        if len(attempts) < 3:
+            raise ConnectionError("temporary")
+        return "ok"
+
+    assert call_with_retry(flaky, retries=4, base_delay=0.05, bucket=bucket) == "ok"
+    assert len(attempts) == len(taken) == 3
+    gaps = np.diff(attempts)
+    assert gaps[0] >= 0.05 and gaps[1] >= 0.1
+
+    def broken():
+        raise ConnectionError("down")
+
+    with pytest.raises(ConnectionError):
+        call_with_retry(broken, retries=2, base_delay=0.001)
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import matplotlib
+import numpy as np
+
+matplotlib.use("Agg")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "modeling"))
+import render
+
+
+def test_frames_are_rendered_from_lookup_tables_and_written_headless(tmp_path):
+    fuel_rgb = np.full((4, 4, 3), 7, dtype=np.uint8)
+    state = np.zeros((4, 4))
+    state[0, 0], state[1, 1], state[2, 2] = 1, 2, 1
+    firebreak = np.zeros((4, 4), dtype=bool)
+    firebreak[2, :] = True
+
+    frame = render.frame_rgb(fuel_rgb, state, firebreak)
+    assert frame.dtype == np.uint8 and frame.shape == (4, 4, 3)
+    assert tuple(frame[0, 0]) == (255, 0, 0) and tuple(frame[1, 1]) == (0, 0, 0)
+    assert tuple(frame[2, 2]) == (255, 255, 255) and tuple(frame[3, 3]) == (7, 7, 7)
+
+    pattern = str(tmp_path / "frames" / "step_{:02d}.png")
+    renderer = render.FireRenderer(fuel_rgb, firebreak, output=pattern)
+    for _ in range(3):
+        renderer.show(state)
+    renderer.close()
+    assert sorted(os.listdir(tmp_path / "frames")) == ["step_00.png", "step_01.png", "step_02.png"]
+
+    gif = str(tmp_path / "fire.gif")
+    renderer = render.FireRenderer(fuel_rgb, output=gif)
+    renderer.show(state)
+    renderer.close()
+    assert os.path.getsize(gif) > 0
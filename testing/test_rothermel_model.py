@@ -0,0 +1,81 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "modeling"))
+import build_env
+import rothermel_model
+
+
+def test_slope_aspect_uses_grid_spacing_and_direction():
+    coords = build_env.get_cell_centers((37.5, -119.0), radius=10, grid_size=30)
+    north_m, east_m = np.meshgrid(np.arange(30) * 2000 / 3, np.arange(30) * 2000 / 3, indexing="ij")
+    assert np.allclose(rothermel_model.cell_spacing(coords), (2000 / 3, 2000 / 3))
+
+    # Terrain rising 10 m per 100 m toward the east faces west.
+    slope, aspect = rothermel_model.slope_aspect(0.1 * east_m, coords)
+    assert np.allclose(slope, 10.0, atol=1e-3) and np.allclose(aspect, 270.0)
+
+    # 3-4-5 plane rising toward the north-east faces south-west.
+    slope, aspect = rothermel_model.slope_aspect(0.03 * east_m + 0.04 * north_m, coords)
+    assert np.allclose(slope, 5.0, atol=1e-3)
+    assert np.allclose(aspect, 180 + np.degrees(np.arctan2(3, 4)), atol=1e-3)
+
+
+def test_hourly_inputs_update_only_changed_cells():
+    env = build_env.Environment.empty(20, [rothermel_model.environment.WIND_SPEED])
+    env.coords = build_env.get_cell_centers((37.5, -119.0), radius=10, grid_size=20)
+    env.fuel[:] = env.original_fuel[:] = rothermel_model.fuel_models.code_of("GR2")
+    env.fields[rothermel_model.environment.WIND_SPEED][:] = 5.0
+
+    # Three hours: the wind picks up over the northern half in hour 1.
+    winds = np.full((3, 20, 20, 1), 5.0, dtype=np.float32)
+    winds[1:, 10:] = 40.0
+    build_env.set_forecast(env, winds.reshape(3, 400, 1), 3600 * np.arange(3))
+    env.forecast_fields = [rothermel_model.environment.WIND_SPEED]
+
+    hourly = rothermel_model.HourlyInputs(env, step_minutes=20)
+    static = hourly.at_step(2)
+    assert static is rothermel_model.get_inputs(env)
+    windy = hourly.at_step(3)
+    assert hourly.cells_updated == 200
+    assert np.all(windy["ros"][10:] > static["ros"][10:]) and np.array_equal(windy["ros"][:10], static["ros"][:10])
+    assert hourly.at_step(100) is hourly.at_step(6)
+
+    full, _ = rothermel_model.calculate_ros_array(env.original_fuel, windy["wind_speed"], windy["slope"],
+                                                  windy["moisture"], windy["live_fuel_moisture"])
+    assert np.allclose(windy["ros"], full)
+
+
+def test_calculate_ros_array_matches_scalar_model_for_every_fuel():
+    params = rothermel_model.fuel_models.load_fuel_model_params()
+    table = rothermel_model.get_fuel_table()
+    codes = [code for code, name in enumerate(rothermel_model.fuel_models.FUEL_CODES)
+             if table.defined[code] or name.startswith("NB")]
+
+    # Moisture on both sides of every extinction value (15/25/30/40) and live
+    # fuel moisture at and between the curing brackets.
+    wind, slope, moisture, lfmc = np.meshgrid([0.0, 20.0], [0.0, 30.0], [0.05, 0.2, 14.0, 16.0, 35.0, 45.0],
+                                              [30.0, 59.0, 60.0, 75.0, 89.0, 90.0, 120.0], indexing="ij")
+    wind, slope, moisture, lfmc = (a.ravel() for a in (wind, slope, moisture, lfmc))
+    spread_cases = cutoff_cases = extinct_cases = 0
+    for code in codes:
+        fuel_code = np.full(wind.shape, code)
+        ros, status = rothermel_model.calculate_ros_array(fuel_code, wind, slope, moisture, lfmc)
+        for k in range(len(wind)):
+            expected = rothermel_model.calculate_ros(rothermel_model.fuel_models.name_of(code), wind[k], slope[k],
+                                                     moisture[k], lfmc[k], params)
+            assert np.isclose(ros[k], expected["ros"]) and status[k] == expected["status_code"]
+        spread_cases += np.count_nonzero(status)
+        cutoff_cases += np.count_nonzero((status == 0) & (moisture <= table.extinction_moisture[code]))
+        extinct_cases += np.count_nonzero(moisture > table.extinction_moisture[code])
+    assert spread_cases > 0 and cutoff_cases > 0 and extinct_cases > 0
+
+    unknown = rothermel_model.fuel_models.code_of("TL3")
+    assert not table.defined[unknown]
+    with pytest.raises(ValueError):
+        rothermel_model.calculate_ros_array(np.array([codes[-1], unknown]), 5.0, 0.0, 5.0, 60.0)
+    with pytest.raises(ValueError):
+        rothermel_model.calculate_ros("TL3", 5.0, 0.0, 5.0, 60.0, params)
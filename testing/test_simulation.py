@@ -0,0 +1,298 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+MODELING = os.path.join(os.path.dirname(__file__), "..", "modeling")
+sys.path.insert(0, MODELING)
+import build_env
+import spread_engine
+from simulation import FireSimulation
+
+
+def make_env(n, fuel, wind):
+    env = build_env.Environment.empty(n, ["Wind Speed (80 m)"])
+    env.coords = build_env.get_cell_centers((37.5, -119.0), radius=10, grid_size=n)
+    env.fuel[:] = env.original_fuel[:] = build_env.google_earth_segmentation.fuel_models.code_of(fuel)
+    env.fields["Wind Speed (80 m)"][:] = wind
+    return env
+
+
+def test_importing_modules_has_no_side_effects(tmp_path):
+    code = ("import sys, fire_spread_sim, optimize_firebreak_sa, fire_spread_sim_without_fb, simulate_no_firebreak; "
+            "print(sorted(m for m in ('pandas', 'matplotlib', 'ee', 'geemap', 'openmeteo_requests') if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, capture_output=True, text=True,
+                            env={**os.environ, "PYTHONPATH": os.path.abspath(MODELING)})
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
+    assert os.listdir(tmp_path) == []
+
+
+def test_simulations_of_different_environments_share_a_process():
+    calm = FireSimulation(make_env(21, "GR1", 5.0), rng=spread_engine.CommonRandomNumbers(4))
+    windy = FireSimulation(make_env(25, "GR2", 60.0), engine="frontier", rng=spread_engine.CommonRandomNumbers(4))
+    assert windy.start == (12, 12)
+
+    vectorized = calm.run().copy()
+    assert np.array_equal(calm.run(engine="frontier"), vectorized)
+    assert windy.run().shape == (25, 25)
+
+    # Continuing a run from step 10 gives the same fire as one 30-step run.
+    calm.run(iterations=10)
+    assert calm.t == 10
+    assert np.array_equal(calm.run(iterations=20, reset=False), vectorized)
+
+    firebreak = np.zeros((21, 21), dtype=bool)
+    firebreak[8:13, 8:13] = True
+    firebreak[10, 10] = False
+    assert np.all(calm.run(overlay_mask=firebreak)[firebreak] == spread_engine.UNBURNED)
+    assert np.all(calm.ensemble(8, overlay_mask=firebreak).burn_probability[firebreak] == 0)
+
+
+def test_baseline_is_cached_per_environment_parameters_and_seed(tmp_path):
+    from result_cache import ResultCache
+
+    env = make_env(21, "GR1", 5.0)
+    cache = ResultCache(str(tmp_path))
+    first = FireSimulation(env).baseline(8, seed=3, cache=cache)
+    again = FireSimulation(env).baseline(8, seed=3, cache=cache)
+    assert (cache.misses, cache.hits) == (1, 1)
+    assert np.array_equal(first.states, again.states)
+
+    # Baselines share the candidates' noise: an empty overlay scores the same.
+    sim = FireSimulation(env)
+    empty = np.zeros((21, 21), dtype=bool)
+    assert sim.ensemble(8, overlay_mask=empty, rng=spread_engine.CommonRandomNumbers(3)).mean_unburned == first.mean_unburned
+
+    # Another seed, other parameters or a changed environment miss.
+    FireSimulation(env).baseline(8, seed=4, cache=cache)
+    FireSimulation(env, max_ros=50.0).baseline(8, seed=3, cache=cache)
+    env.fields["Wind Speed (80 m)"][0, 0] = 6.0
+    FireSimulation(env).baseline(8, seed=3, cache=cache)
+    assert (cache.misses, cache.hits) == (4, 1)
+    assert len(os.listdir(tmp_path)) == 4
+
+
+def test_resuming_after_a_firebreak_edit_matches_a_full_run():
+    crn = spread_engine.CommonRandomNumbers(7)
+    sim = FireSimulation(make_env(41, "GR1", 5.0), neighbors=16, rng=crn, iterations=40)
+    baseline = sim.baseline(16, seed=7)
+    reference = sim.run().copy()
+    assert np.array_equal(spread_engine.state_at(sim.ignition_step, sim.t), reference)
+
+    # A firebreak far from the ignition is only reached late in the run.
+    firebreak = np.zeros((41, 41), dtype=bool)
+    firebreak[2:4, 30:38] = True
+    full = sim.ensemble(16, overlay_mask=firebreak, rng=crn, record=True)
+    resumed = sim.resume_ensemble(baseline, None, firebreak, rng=crn)
+    assert resumed.start_step > 0
+    assert np.array_equal(resumed.states, full.states)
+    assert np.array_equal(resumed.ignition_step, full.ignition_step)
+
+    # Moving it again resumes from the edited run.
+    moved = np.roll(firebreak, 1, axis=1)
+    again = sim.resume_ensemble(resumed, firebreak, moved, rng=crn)
+    assert np.array_equal(again.states, sim.ensemble(16, overlay_mask=moved, rng=crn).states)
+
+    sim.run()
+    resumed_state = sim.resume(sim.ignition_step, None, firebreak).copy()
+    assert np.array_equal(resumed_state, sim.run(overlay_mask=firebreak))
+
+
+def test_firebreaks_outside_the_burn_envelope_leave_the_baseline_unchanged():
+    from burn_envelope import BurnEnvelope
+
+    sim = FireSimulation(make_env(41, "GR1", 5.0), iterations=20)
+    baseline = sim.baseline(16, seed=5)
+    envelope = BurnEnvelope(baseline.burn_probability)
+    assert envelope.mask[sim.start] and 0 < envelope.coverage < 1
+
+    outside = [(i, 2) for i in range(5, 15)]
+    assert not envelope.reaches(outside) and envelope.weight(outside) == 0
+    firebreak = np.zeros((41, 41), dtype=bool)
+    firebreak[tuple(np.transpose(outside))] = True
+    result = sim.ensemble(16, overlay_mask=firebreak, rng=spread_engine.CommonRandomNumbers(5))
+    assert np.array_equal(result.states, baseline.states)
+
+    crossing = [(20, j) for j in range(15, 26)]
+    assert envelope.reaches(crossing) and envelope.weight(crossing) > 1
+
+    # Over 8 neighbors a firebreak also blocks the diagonal moves across it, so
+    # cells bordering the envelope can change the fire without ever burning.
+    diagonal = FireSimulation(make_env(41, "GR1", 5.0), iterations=20, neighbors=8)
+    baseline = diagonal.baseline(8, seed=5)
+    envelope = BurnEnvelope(baseline.burn_probability)
+    bordering = np.zeros((41, 41), dtype=bool)
+    for di, dj in spread_engine.DIRECTIONS_8:
+        bordering |= spread_engine.shift(envelope.mask, di, dj)
+    changed = False
+    for i, j in zip(*np.nonzero(bordering & ~envelope.mask)):
+        pruned = not envelope.reaches([(i, j)], spread_engine.DIRECTIONS_8)
+        if not pruned and changed:
+            continue
+        firebreak = np.zeros((41, 41), dtype=bool)
+        firebreak[i, j] = True
+        result = diagonal.ensemble(8, overlay_mask=firebreak, rng=spread_engine.CommonRandomNumbers(5))
+        same = np.array_equal(result.states, baseline.states)
+        assert same or not pruned
+        changed |= not same
+    assert changed
+
+    # Deterministic envelope: the cells the front reaches within an hour.
+    hour = BurnEnvelope.from_arrival(sim.arrival_time(), 60)
+    assert hour.mask[sim.start] and hour.coverage < 1
+
+
+def test_candidate_cache_shares_masks_refines_and_evicts():
+    from firebreak_utils import rasterize_firebreak
+    from result_cache import CandidateCache
+
+    def mask_of(cells):
+        mask = np.zeros((21, 21), dtype=bool)
+        mask[tuple(np.transpose(cells))] = True
+        return mask
+
+    sim = FireSimulation(make_env(21, "GR1", 5.0))
+    cache = CandidateCache(max_entries=2)
+    # Lines clipped at the edge cover the same cells whatever their length.
+    edge = mask_of(rasterize_firebreak(21, 2, 15, 0, 10))
+    assert np.array_equal(edge, mask_of(rasterize_firebreak(21, 2, 15, 0, 12)))
+    assert cache.get(edge) is None
+
+    first = cache.add(edge, sim.ensemble(8, overlay_mask=edge))
+    assert cache.get(mask_of(rasterize_firebreak(21, 2, 15, 0, 12))) is first
+    assert cache.get(edge, min_realizations=16) is None
+    refined = cache.add(edge, sim.ensemble(8, overlay_mask=edge))
+    assert refined.realizations == 16 and cache.get(edge, min_realizations=16) is refined
+    assert (cache.hits, cache.misses) == (2, 2) and cache.hit_rate == 0.5
+
+    # The least recently used mask is dropped first.
+    other = mask_of(rasterize_firebreak(21, 5, 5, 90, 6))
+    cache.add(other, sim.ensemble(4, overlay_mask=other))
+    cache.get(edge)
+    cache.add(~edge & ~other, sim.ensemble(4))
+    assert cache.get(other) is None and cache.get(edge) is refined
+
+
+def test_optimizer_reports_a_missing_base_grid(tmp_path, monkeypatch):
+    import optimize_firebreak_sa
+
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(FileNotFoundError, match="saved_grid"):
+        optimize_firebreak_sa.load_base_grid()
+
+
+def test_overlapping_firebreak_overlays_can_be_removed_in_either_order():
+    from environment import FirebreakOverlay
+    from firebreak_utils import rasterize_firebreak
+
+    env = make_env(21, "GR1", 5.0)
+    fuel = env.fuel.copy()
+    sim = FireSimulation(env)
+    across = rasterize_firebreak(21, 10, 5, 0, 11)
+    down = rasterize_firebreak(21, 5, 10, 90, 11)
+    assert set(across) & set(down) == {(10, 10)}
+
+    for first, second in ((across, down), (down, across)):
+        overlay = FirebreakOverlay(env)
+        overlay.apply(first)
+        overlay.apply(second)
+        assert overlay.mask.sum() == 21 and overlay.counts[10, 10] == 2
+
+        # The shared cell stays a firebreak until both are removed.
+        overlay.remove(first)
+        assert overlay.mask[10, 10] and not sim.burnable(overlay.mask)[10, 10]
+        remaining = np.zeros((21, 21), dtype=bool)
+        remaining[tuple(np.transpose(second))] = True
+        assert np.array_equal(overlay.mask, remaining)
+        overlay.remove(second)
+        assert not overlay.mask.any() and np.all(overlay.counts == 0)
+        assert np.array_equal(sim.burnable(overlay.mask), sim.burnable())
+        assert np.array_equal(env.fuel, fuel)
+
+
+def test_runs_with_and_without_firebreaks_use_the_same_simulation(monkeypatch):
+    import fire_spread_sim
+    import fire_spread_sim_without_fb
+
+    from environment import SOIL_MOISTURE
+
+    # The fuel is too wet to burn from the second forecast hour on.
+    env = make_env(30, "GR1", 5.0)
+    env.forecast = np.repeat(np.array([0.05, 30, 30], dtype=np.float32), 900).reshape(3, 30, 30, 1)
+    env.forecast_times = 1700000000 + 3600 * np.arange(3)
+    env.forecast_fields = [SOIL_MOISTURE]
+    monkeypatch.setattr(fire_spread_sim_without_fb, "grid", env)
+
+    def crn():
+        return spread_engine.CommonRandomNumbers(2)
+
+    without_fb = fire_spread_sim_without_fb.run_fire_simulation_without_fb(display=False, rng=crn(),
+                                                                           engine="vectorized")
+    with_overlay = fire_spread_sim.run_fire_simulation(custom_grid=env, display=False, engine="vectorized", rng=crn())
+    optimizer_baseline = FireSimulation(env, iterations=30, engine="vectorized", rng=crn()).run()
+    assert np.array_equal(without_fb, with_overlay) and np.array_equal(without_fb, optimizer_baseline)
+    assert not np.array_equal(without_fb, FireSimulation(env, hourly_weather=False, rng=crn()).run())
+
+
+# The optimizer module with `env` saved as its base grid in tmp_path.
+def optimizer_on(env, tmp_path, monkeypatch):
+    import env_store
+    import optimize_firebreak_sa
+
+    monkeypatch.chdir(tmp_path)
+    env_store.save_environment(env, "saved_grid")
+    monkeypatch.setattr(optimize_firebreak_sa, "_base_grid", None)
+    optimize_firebreak_sa.load_base_grid()
+    return optimize_firebreak_sa
+
+
+def test_optimizer_skips_candidates_that_block_the_ignition_or_never_spread(tmp_path, monkeypatch):
+    sa = optimizer_on(make_env(30, "GR1", 5.0), tmp_path, monkeypatch)
+    covering = {"start_i": 26, "start_j": 4, "angle": 315, "length": 23}
+    assert sa.blocks_ignition(covering)
+    neighbors = sa.candidate_neighbors(covering)
+    assert neighbors and len(neighbors) < len(sa.get_neighbors(covering))
+    assert not any(sa.blocks_ignition(params) for params in neighbors)
+
+    # Realizations whose fire stayed at the ignition do not count toward the score.
+    def ensemble_burning(*burned):
+        states = np.zeros((len(burned), 900), dtype=np.int8)
+        for k, count in enumerate(burned):
+            states[k, :count] = spread_engine.BURNED
+        return spread_engine.EnsembleResult(states.reshape(-1, 30, 30))
+
+    assert sa.spread_unburned(ensemble_burning(1, 300, 200, 5), covering) == 650.0
+    assert sa.spread_unburned(ensemble_burning(1, 10), covering) is None
+
+
+def test_seeded_parallel_optimizer_runs_repeat(tmp_path, monkeypatch, capsys):
+    sa = optimizer_on(make_env(30, "GR1", 5.0), tmp_path, monkeypatch)
+    monkeypatch.setattr(sa, "MAX_ITERS", 6)
+    monkeypatch.setattr(sa, "ENSEMBLE_SIZE", 4)
+    monkeypatch.setattr(sa, "CACHE_BASELINE", False)
+    monkeypatch.setattr(sa, "visualize_best_firebreak_on_clean_grid", lambda params: None)
+
+    for common_random_numbers in (True, False):
+        trajectories = []
+        for _ in range(2):
+            sa.simulated_annealing(workers=2, seed=11, common_random_numbers=common_random_numbers)
+            lines = capsys.readouterr().out.splitlines()
+            trajectories.append([line for line in lines if line.startswith(("[Step", "Best Firebreak"))])
+        assert len(trajectories[0]) == 7
+        assert trajectories[0] == trajectories[1]
+
+
+def test_a_pruned_candidate_does_not_become_the_resume_reference(tmp_path, monkeypatch):
+    # A pruned candidate scores as the baseline, which does not include its firebreak.
+    sa = optimizer_on(make_env(30, "GR1", 5.0), tmp_path, monkeypatch)
+    crn = spread_engine.CommonRandomNumbers(1)
+    baseline = sa._simulation.ensemble(4, rng=crn, record=True)
+    previous = (None, baseline)
+    far = {"start_i": 0, "start_j": 0, "angle": 0, "length": 5}
+    assert sa.accepted_reference(previous, far, baseline, baseline) is previous
+    result = sa._simulation.ensemble(4, overlay_mask=sa.create_firebreak(far).firebreak_mask, rng=crn, record=True)
+    mask, reference = sa.accepted_reference(previous, far, result, baseline)
+    assert reference is result and np.array_equal(mask, sa.create_firebreak(far).firebreak_mask)
@@ -0,0 +1,186 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "modeling"))
+import spread_engine
+
+
+# Reference per-cell loop, same rules as fire_spread_sim.run_fire_simulation(engine="loop").
+def loop_step(fire_state, spread_prob, burnable):
+    n = fire_state.shape[0]
+    new_state = fire_state.copy()
+    for i, j in zip(*np.nonzero(fire_state == spread_engine.BURNING)):
+        new_state[i, j] = spread_engine.BURNED
+        for di, dj in spread_engine.DIRECTIONS_4:
+            ni, nj = i + di, j + dj
+            if 0 <= ni < n and 0 <= nj < n:
+                if burnable[ni, nj] and fire_state[ni, nj] == 0 and np.random.rand() < spread_prob[i, j]:
+                    new_state[ni, nj] = spread_engine.BURNING
+    return new_state
+
+
+def test_shift_moves_values_toward_direction():
+    field = np.arange(9.0).reshape(3, 3)
+    shifted = spread_engine.shift(field, 1, 0)
+    assert np.array_equal(shifted[0], [0, 0, 0])
+    assert np.array_equal(shifted[1:], field[:2])
+
+
+def test_step_certain_spread_reaches_four_neighbors():
+    state = np.zeros((5, 5))
+    state[2, 2] = spread_engine.BURNING
+    burnable = np.ones((5, 5), dtype=bool)
+    burnable[1, 2] = False
+    spread_engine.step(state, np.ones((5, 5)), burnable, np.zeros((5, 5)))
+    assert state[2, 2] == spread_engine.BURNED
+    assert state[1, 2] == spread_engine.UNBURNED
+    assert sorted(zip(*np.nonzero(state == spread_engine.BURNING))) == [(2, 1), (2, 3), (3, 2)]
+
+
+def test_vectorized_matches_loop_in_distribution():
+    np.random.seed(0)
+    n, iterations, runs = 15, 8, 2000
+    spread_prob = np.random.uniform(0.3, 0.6, (n, n))
+    burnable = np.random.rand(n, n) > 0.05
+
+    def burned_area(step_fn):
+        state = np.zeros((n, n))
+        state[n // 2, n // 2] = spread_engine.BURNING
+        for _ in range(iterations):
+            state = step_fn(state)
+        return np.count_nonzero(state)
+
+    def vectorized_step(state):
+        spread_engine.step(state, spread_prob, burnable, np.random.rand(n, n))
+        return state
+
+    loop = [burned_area(lambda s: loop_step(s, spread_prob, burnable)) for _ in range(runs)]
+    vectorized = [burned_area(vectorized_step) for _ in range(runs)]
+    stderr = np.sqrt((np.var(loop) + np.var(vectorized)) / runs)
+    assert abs(np.mean(loop) - np.mean(vectorized)) < 4 * stderr
+
+
+def test_ensemble_statistics():
+    np.random.seed(1)
+    n = 11
+    ros = np.full((n, n), 50.0)
+    burnable = np.ones((n, n), dtype=bool)
+    result = spread_engine.run_ensemble(ros, burnable, (5, 5), realizations=200, iterations=10, max_ros=100.0)
+    assert result.states.shape == (200, n, n)
+    assert result.burn_probability[5, 5] == 1.0
+    low, high = result.confidence_interval()
+    assert low < result.mean_unburned < high
+    assert result.unburned.min() < n * n
+
+    # Certain spread with no decay burns the whole grid in every realization.
+    certain = spread_engine.run_ensemble(ros, burnable, (5, 5), 4, 20, max_ros=50.0, decay_rate=0.0)
+    assert np.all(certain.unburned == 0)
+
+
+def test_common_random_numbers_reproduce_runs():
+    n = 15
+    ros = np.full((n, n), 40.0)
+    burnable = np.ones((n, n), dtype=bool)
+    crn = spread_engine.CommonRandomNumbers(seed=3)
+    first = spread_engine.run_ensemble(ros, burnable, (7, 7), 8, 20, 100.0, rng=crn)
+    second = spread_engine.run_ensemble(ros, burnable, (7, 7), 8, 20, 100.0, rng=crn)
+    assert np.array_equal(first.states, second.states)
+
+    seeded = [spread_engine.run_ensemble(ros, burnable, (7, 7), 8, 20, 100.0, rng=np.random.default_rng(5))
+              for _ in range(2)]
+    assert np.array_equal(seeded[0].states, seeded[1].states)
+    assert np.array_equal(crn.draws(4, (2, 3)), crn.draws(4, (2, 3)))
+    assert not np.array_equal(crn.draws(4, (2, 3)), crn.draws(5, (2, 3)))
+
+    # Draws of single cells match the full field, across generation blocks.
+    field = crn.draws(6, (3, 300, 300))
+    cells = np.random.default_rng(0).choice(field.size, 500, replace=False)
+    assert np.array_equal(crn.cell_draws(6, cells), field.ravel()[cells])
+    assert field.dtype == np.float32 and 0.0 <= field.min() and field.max() < 1.0
+    assert abs(field.mean() - 0.5) < 0.005 and abs(field.var() - 1 / 12) < 0.002
+
+
+def test_direction_weights_favor_downwind_and_upslope():
+    n = 5
+    zeros = np.zeros((n, n), dtype=np.float32)
+    calm = spread_engine.direction_weights(spread_engine.DIRECTIONS_8, zeros, zeros, zeros, zeros)
+    assert calm.shape == (8, n, n) and np.allclose(calm.sum(axis=0), 4.0)
+    assert np.allclose(calm[:4], calm[0, 0, 0]) and np.allclose(calm[4:], calm[0, 0, 0] / np.sqrt(2))
+
+    # Wind from the west pushes fire east (dj = 1); terrain facing north (aspect 0) rises to the south.
+    west_wind = spread_engine.direction_weights(spread_engine.DIRECTIONS_4, zeros + 30, zeros + 270, zeros, zeros)
+    assert np.argmax(west_wind[:, 0, 0]) == spread_engine.DIRECTIONS_4.index((0, 1))
+    slope = spread_engine.direction_weights(spread_engine.DIRECTIONS_16, zeros, zeros, zeros + 30, zeros)
+    assert spread_engine.DIRECTIONS_16[np.argmax(slope[:, 0, 0])] == (-1, 0)
+
+
+def test_anisotropic_ensemble_spreads_downwind():
+    n = 31
+    ros = np.full((n, n), 40.0)
+    burnable = np.ones((n, n), dtype=bool)
+    weights = spread_engine.direction_weights(spread_engine.DIRECTIONS_8, np.full((n, n), 40.0),
+                                              np.full((n, n), 270.0), np.zeros((n, n)), np.zeros((n, n)))
+    result = spread_engine.run_ensemble(ros, burnable, (15, 15), 64, 12, 100.0, rng=np.random.default_rng(0),
+                                        directions=spread_engine.DIRECTIONS_8, weights=weights)
+    burned_columns = result.burn_probability.sum(axis=0)
+    assert burned_columns[16:].sum() > 2 * burned_columns[:15].sum()
+
+
+def test_one_cell_firebreak_stops_diagonal_and_knight_moves():
+    from firebreak_utils import rasterize_firebreak
+    n = 21
+    ros = np.full((n, n), 50.0)
+    burnable = np.ones((n, n), dtype=bool)
+    for i, j in rasterize_firebreak(n, 0, 0, 45, n):
+        burnable[i, j] = False
+    below, above = np.tril(burnable), np.triu(np.ones((n, n), dtype=bool))
+    wind = spread_engine.direction_weights(spread_engine.DIRECTIONS_16, np.full((n, n), 40.0),
+                                           np.full((n, n), 315.0), np.zeros((n, n)), np.zeros((n, n)))
+
+    for neighbors in (8, 16):
+        directions = spread_engine.STENCILS[neighbors]
+        # Certain spread with no decay burns everything on the ignition side.
+        certain = spread_engine.run_ensemble(ros, burnable, (15, 5), 2, 60, 50.0, decay_rate=0.0,
+                                             directions=directions)
+        assert np.all(certain.states[:, below] != spread_engine.UNBURNED)
+        assert np.all(certain.states[:, above] == spread_engine.UNBURNED)
+
+        # Wind toward the break, with the frontier engine's full-grid and sparse steps.
+        for dense_fraction in (0.0, 1.0):
+            state = np.zeros((n, n), dtype=np.int8)
+            state[15, 5] = spread_engine.BURNING
+            spread_engine.run_frontier(ros, burnable, state, 60, 50.0, decay_rate=0.0,
+                                       rng=spread_engine.CommonRandomNumbers(seed=4), directions=directions,
+                                       weights=wind[:neighbors], dense_fraction=dense_fraction)
+            assert np.any(state[below] != spread_engine.UNBURNED)
+            assert np.all(state[above] == spread_engine.UNBURNED)
+
+
+def test_frontier_engine_matches_dense_steps_and_stops_early():
+    n = 41
+    rng = np.random.default_rng(2)
+    ros = rng.uniform(20, 80, (n, n)).astype(np.float32)
+    burnable = rng.random((n, n)) > 0.1
+    burnable[20, 20] = True
+    crn = spread_engine.CommonRandomNumbers(seed=9)
+
+    def start():
+        state = np.zeros((n, n), dtype=np.int8)
+        state[20, 20] = spread_engine.BURNING
+        return state
+
+    # dense_fraction 0 and 1 force full-grid and sparse steps throughout.
+    dense, sparse, auto = start(), start(), start()
+    spread_engine.run_frontier(ros, burnable, dense, 25, 100.0, rng=crn, dense_fraction=0.0)
+    spread_engine.run_frontier(ros, burnable, sparse, 25, 100.0, rng=crn, dense_fraction=1.0)
+    spread_engine.run_frontier(ros, burnable, auto, 25, 100.0, rng=crn)
+    assert np.array_equal(dense, sparse) and np.array_equal(dense, auto)
+
+    # With no burnable neighbors the fire dies after one step.
+    isolated = np.zeros((n, n), dtype=bool)
+    isolated[20, 20] = True
+    state = start()
+    assert spread_engine.run_frontier(ros, isolated, state, 25, 100.0, rng=crn) == 1
+    assert state[20, 20] == spread_engine.BURNED
@@ -0,0 +1,77 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "modeling"))
+import spread_engine
+import travel_time
+
+
+def test_uniform_ros_arrival_matches_distance():
+    n = 41
+    ros = np.full((n, n), 2.0)
+    burnable = np.ones((n, n), dtype=bool)
+    arrival = travel_time.arrival_times(ros, burnable, (20, 20), (30.0, 30.0))
+    assert arrival[20, 20] == 0.0
+    assert np.isclose(arrival[20, 30], 10 * 30 / 2.0)
+
+    i, j = np.indices((n, n))
+    exact = np.hypot(i - 20, j - 20) * 30 / 2.0
+    assert np.all(arrival >= exact - 1e-9) and np.all(arrival <= 1.03 * exact + 1e-9)
+
+    index = travel_time.isochrones(arrival, 60)
+    assert index[20, 20] == 0 and index[20, 30] == 2
+    assert np.array_equal(travel_time.burned_within(arrival, 60), index == 0)
+
+
+def test_firebreaks_and_wind_shape_arrival():
+    n = 21
+    ros = np.full((n, n), 5.0)
+    burnable = np.ones((n, n), dtype=bool)
+    burnable[:, 14:16] = False  # two cells wide: the 16-neighbor stencil cannot jump it
+    arrival = travel_time.arrival_times(ros, burnable, (10, 5), (30.0, 30.0))
+    assert np.all(np.isinf(arrival[:, 14:]))
+    assert np.all(np.isfinite(arrival[:, :14]))
+
+    # Wind from the west: the fire reaches cells to the east sooner, and
+    # max_minutes stops the search.
+    zeros = np.zeros((n, n), dtype=np.float32)
+    factors = spread_engine.direction_factors(spread_engine.DIRECTIONS_16, zeros + 30, zeros + 270, zeros, zeros)
+    windy = travel_time.arrival_times(ros, np.ones((n, n), dtype=bool), (10, 10), (30.0, 30.0), factors=factors)
+    assert windy[10, 15] < windy[10, 5]
+    limited = travel_time.arrival_times(ros, np.ones((n, n), dtype=bool), (10, 10), (30.0, 30.0), factors=factors,
+                                        max_minutes=30)
+    assert np.array_equal(np.isfinite(limited), windy <= 30)
+
+
+def test_one_cell_firebreaks_stop_diagonal_and_knight_moves():
+    from firebreak_utils import rasterize_firebreak
+    n = 21
+    ros = np.full((n, n), 5.0)
+    for angle, start in ((90, (0, 10)), (45, (0, 0))):
+        burnable = np.ones((n, n), dtype=bool)
+        for i, j in rasterize_firebreak(n, *start, angle, n):
+            burnable[i, j] = False
+        far_side = np.zeros((n, n), dtype=bool)
+        far_side[:, 11:] = angle == 90
+        far_side |= (angle == 45) & np.triu(np.ones((n, n), dtype=bool), 1)
+        for directions in (spread_engine.DIRECTIONS_8, spread_engine.DIRECTIONS_16):
+            arrival = travel_time.arrival_times(ros, burnable, (15, 5), (30.0, 30.0), directions)
+            assert np.all(np.isinf(arrival[far_side]))
+            assert np.all(np.isfinite(arrival[burnable & ~far_side]))
+
+    # Blocked moves take inf in edge_times too.
+    times = travel_time.edge_times(ros, (30.0, 30.0), spread_engine.DIRECTIONS_8, burnable=burnable)
+    assert np.isinf(times[5 * n + 4, spread_engine.DIRECTIONS_8.index((-1, 1))])
+    assert np.isfinite(times[5 * n + 4, spread_engine.DIRECTIONS_8.index((1, -1))])
+
+
+def test_hourly_ros_changes_speed():
+    n = 31
+    burnable = np.ones((n, n), dtype=bool)
+    slow_then_fast = travel_time.arrival_times(lambda hour: np.full((n, n), 1.0 if hour == 0 else 10.0),
+                                               burnable, (0, 0), (30.0, 30.0))
+    # 60 m in the first hour at 1 m/min, then 10 m/min.
+    assert np.isclose(slow_then_fast[0, 2], 60.0)
+    assert np.isclose(slow_then_fast[0, 12], 60.0 + 10 * 30 / 10.0)